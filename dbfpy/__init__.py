@@ -1,3 +1,5 @@
-from . import dbf, fields, record, header, utils, code_page
+from . import dbf, fields, record, header, utils, code_page, codec, batch, \
+    arrays, parallel, query, writer, vacuum
+from .writer import DbfWriter
 
-__all__ = ['dbf']
+__all__ = ['dbf', 'DbfWriter']
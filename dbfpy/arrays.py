@@ -0,0 +1,226 @@
+"""NumPy structured array export and import.
+
+NumPy is an optional dependency (``pip install dbfpy[numpy]``);
+functions of this module raise ImportError if it is not installed.
+
+The raw record area is mapped onto a structured dtype built from the
+field definitions (see `raw_dtype`), so no per-record Python code runs.
+`to_numpy` converts the raw columns to native types:
+
+    ====  ==================  ====================
+    Type  Raw column          Converted column
+    ====  ==================  ====================
+    C     ``S<length>``       ``U<length>``
+    N, F  ``S<length>``       ``float64``
+    D     ``S8``              ``datetime64[D]``
+    I     ``int32``           ``int32``
+    Y     ``int64``           ``float64``
+    L     ``S1``              ``bool``
+    ====  ==================  ====================
+
+Other fields (memo pointers, timestamps) are returned raw.
+
+"""
+
+__all__ = ["raw_dtype", "to_numpy", "from_numpy"]
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("NumPy is required for the array support")
+
+
+def _names(header):
+    """Return field names as str objects."""
+    return [field.name.decode(header.code_page.encoding)
+            for field in header.fields]
+
+
+def raw_dtype(header):
+    """Return structured dtype of the raw record for the ``header``.
+
+    The deletion flag is available as the ``_deleted`` (``S1``) field.
+    """
+    _require_numpy()
+    names = ["_deleted"]
+    formats = ["S1"]
+    offsets = [0]
+    for (name, field) in zip(_names(header), header.fields):
+        if field.struct_code is not None and \
+                numpy.dtype("<" + field.struct_code).itemsize == field.length:
+            formats.append("<" + field.struct_code)
+        else:
+            formats.append("S%d" % field.length)
+        names.append(name)
+        offsets.append(field.start)
+    return numpy.dtype({
+        "names": names, "formats": formats, "offsets": offsets,
+        "itemsize": header.record_length,
+    })
+
+
+def _decode_numeric(column):
+    """Return ``float64`` array parsed from ASCII numbers."""
+    column = numpy.char.strip(column, b" \x00")
+    # blank values are decoded as zero (see DbfNumericField.decode)
+    column[column == b""] = b"0"
+    try:
+        return column.astype("f8")
+    except ValueError:
+        # invalid value somewhere, parse values one by one
+        result = numpy.empty(len(column), "f8")
+        for (index, value) in enumerate(column):
+            try:
+                result[index] = float(value)
+            except ValueError:
+                result[index] = 0.0
+        return result
+
+
+def _decode_date(column):
+    """Return ``datetime64[D]`` array parsed from "yyyymmdd" values.
+
+    Blank and invalid values become ``NaT``.
+    """
+    digits = numpy.ascontiguousarray(column).view("u1").reshape(-1, 8)
+    digits = digits.astype("i8") - 0x30
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    digits[~valid] = 0
+    year = digits[:, :4].dot([1000, 100, 10, 1])
+    month = digits[:, 4:6].dot([10, 1])
+    day = digits[:, 6:].dot([10, 1])
+    valid &= (month >= 1) & (month <= 12) & (day >= 1)
+    year[~valid] = 1970
+    month[~valid] = day[~valid] = 1
+    result = (
+        (year - 1970).astype("M8[Y]").astype("M8[M]") +
+        (month - 1).astype("m8[M]")
+    ).astype("M8[D]") + (day - 1).astype("m8[D]")
+    # day overflow moves the date into the next month
+    valid &= result.astype("M8[M]").astype("i8") % 12 + 1 == month
+    result[~valid] = numpy.datetime64("NaT")
+    return result
+
+
+def to_numpy(header, data, convert=True, skip_deleted=False):
+    """Return structured array of the records packed in ``data``.
+
+    Arguments:
+        header:
+            `DbfHeader` of the table.
+        data:
+            bytes-like object holding consecutive records.
+        convert:
+            if set, convert raw columns to native types (see module
+            docs); otherwise return array of the `raw_dtype` as is.
+        skip_deleted:
+            if set, deleted records are not included.
+
+    """
+    dtype = raw_dtype(header)
+    raw = numpy.frombuffer(
+        data, dtype, len(data) // header.record_length
+    )
+    if skip_deleted:
+        raw = raw[raw["_deleted"] != b"*"]
+    if not convert:
+        return raw
+
+    encoding = header.code_page.encoding
+    columns = []
+    for (name, field) in zip(_names(header), header.fields):
+        column = raw[name]
+        if field.type_code == b"C":
+            column = numpy.char.rstrip(
+                numpy.char.decode(column, encoding), " "
+            )
+        elif field.type_code in (b"N", b"F"):
+            column = _decode_numeric(column)
+        elif field.type_code == b"D":
+            column = _decode_date(column)
+        elif field.type_code == b"Y" and column.dtype.kind == "i":
+            column = column / 10000.
+        elif field.type_code == b"L":
+            column = numpy.isin(column, [b"T", b"t", b"Y", b"y"])
+        columns.append((name, column))
+
+    result = numpy.empty(
+        len(raw), [(name, column.dtype) for (name, column) in columns]
+    )
+    for (name, column) in columns:
+        result[name] = column
+    return result
+
+
+def _encode_numeric(field, column):
+    """Return ``S<length>`` array of formatted numbers."""
+    result = numpy.char.mod(
+        "%%%d.%df" % (field.length, field.decimal_count),
+        column.astype("f8")
+    ).astype("S")
+    if result.dtype.itemsize > field.length:
+        # same check as in DbfNumericField.encode
+        for value in result:
+            if len(value) > field.length and \
+                    not 0 <= value.find(b".") <= field.length:
+                raise ValueError(
+                    "[%s] Numeric overflow: %s (field length: %i)" %
+                    (field.name, value, field.length)
+                )
+    return result
+
+
+def _encode_date(column):
+    """Return ``S8`` array of "yyyymmdd" values, blank for ``NaT``."""
+    column = column.astype("M8[D]")
+    result = numpy.char.replace(
+        numpy.datetime_as_string(column, unit="D"), "-", ""
+    ).astype("S8")
+    result[numpy.isnat(column)] = b" " * 8
+    return result
+
+
+def from_numpy(header, array):
+    """Return bytes of records encoded from the structured ``array``.
+
+    Fields of the ``array`` are matched with the table fields by name;
+    missing fields get default values. Memo and timestamp fields
+    must be given in the raw form (see `raw_dtype`).
+    """
+    dtype = raw_dtype(header)
+    # start with records of default values; empty string
+    # is an empty (not written) value of the memo fields
+    template = header.encoder.encode([
+        "" if field.is_memo else field.default_value
+        for field in header.fields
+    ])
+    raw = numpy.full(len(array), numpy.frombuffer(template, dtype)[0])
+    encoding = header.code_page.encoding
+    for (name, field) in zip(_names(header), header.fields):
+        if name not in array.dtype.names:
+            continue
+
+        column = array[name]
+        if field.type_code == b"C":
+            if column.dtype.kind == "U":
+                column = numpy.char.encode(column, encoding)
+            column = numpy.char.ljust(
+                column.astype("S"), field.length
+            )
+        elif field.type_code in (b"N", b"F"):
+            column = _encode_numeric(field, column)
+        elif field.type_code == b"D":
+            column = _encode_date(column)
+        elif field.type_code == b"Y":
+            column = numpy.round(column * 10000).astype("<i8")
+        elif field.type_code == b"L":
+            column = numpy.where(column.astype(bool), b"T", b"F")
+        raw[name] = column
+    return raw.tobytes()
+
+# vim: et sts=4 sw=4 :
@@ -0,0 +1,81 @@
+"""Columnar record batches.
+
+"""
+
+__all__ = ["RecordBatch"]
+
+
+class RecordBatch(object):
+    """Block of consecutive records stored column by column.
+
+    Instances are created by `dbf.Dbf.iter_batches`. Every column is an
+    ``array.array`` for the numeric fields (see `fields.DbfField.array_code`)
+    or a list of the decoded values otherwise. Deletion flags are kept
+    in the ``deleted`` bitmap: bit ``i % 8`` of the byte ``i // 8`` is set
+    when the record ``start + i`` is deleted.
+
+    """
+
+    __slots__ = ("header", "start", "names", "columns", "deleted", "length")
+
+    # deletion flag -> bitmap digit ("*" is deleted, anything else is not)
+    _BITS = bytes(0x31 if c == 0x2A else 0x30 for c in range(256))
+
+    def __init__(self, header, start, fields, columns, flags):
+        """Initialize instance.
+
+        Arguments:
+            header:
+                `DbfHeader` of the table.
+            start:
+                index of the first record of the batch.
+            fields:
+                field definitions of the ``columns``.
+            columns:
+                list of decoded columns.
+            flags:
+                deletion flags of the records (one byte per record).
+
+        """
+        self.header = header
+        self.start = start
+        self.names = [field.name for field in fields]
+        self.columns = columns
+        self.length = len(flags)
+        # build the bitmap in one pass: "01.." digits of reversed
+        # flags read as a binary number give the little-endian bitmap
+        bits = flags.translate(self._BITS)[::-1]
+        self.deleted = (int(bits, 2) if bits else 0).to_bytes(
+            (self.length + 7) // 8, "little"
+        )
+
+    def is_deleted(self, index):
+        """True if the record number ``index`` of the batch is deleted."""
+        if not 0 <= index < self.length:
+            raise IndexError("Record index out of range")
+        return bool(self.deleted[index >> 3] & (1 << (index & 7)))
+
+    def column(self, key):
+        """Return column by field name or index."""
+        if isinstance(key, int):
+            return self.columns[key]
+        if isinstance(key, str):
+            key = key.encode(self.header.code_page.encoding)
+        try:
+            return self.columns[self.names.index(key.upper())]
+        except ValueError:
+            raise KeyError(key)
+
+    __getitem__ = column
+
+    def rows(self):
+        """Iterate over tuples of values, record by record."""
+        return zip(*self.columns)
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return "RecordBatch(start=%d, length=%d)" % (self.start, self.length)
+
+# vim: et sts=4 sw=4 :
@@ -0,0 +1,311 @@
+"""Compiled record codecs.
+
+Field layout of a table is fixed, so instead of slicing the record and
+dispatching every field separately, the layout is compiled once into a
+`struct.Struct` and a list of per-field converters (see
+`fields.DbfField.struct_code`, `fields.DbfField.make_decoder` and
+`fields.DbfField.make_encoder`).
+
+"""
+
+__all__ = ["DbfRecordDecoder", "DbfRecordEncoder"]
+
+import array
+import functools
+import struct
+
+from .utils import INVALID_VALUE
+
+
+def _decode_value(converter, value):
+    """Return ``converter(value)`` or ``INVALID_VALUE`` on failure."""
+    if converter is None:
+        return value
+    try:
+        return converter(value)
+    except Exception:
+        return INVALID_VALUE
+
+
+class DbfRecordDecoder(object):
+    """Record decoder compiled for the given field definitions.
+
+    Instances are created by `header.DbfHeader.decoder` and must
+    be recreated when the layout or the code page changes.
+
+    """
+
+    __slots__ = (
+        "fields", "packed_fields", "struct", "converters", "order", "items",
+        "column_converters",
+    )
+
+    def __init__(self, fields, encoding):
+        """Initialize instance.
+
+        Arguments:
+            fields:
+                sequence of `DbfField` to decode; ``start`` of the fields
+                must be set. Fields may be any subset of the record fields
+                in any order; decoded values are returned in this order.
+            encoding:
+                encoding of the character data.
+
+        """
+        self.fields = list(fields)
+
+        # struct fields must follow record layout
+        ordered = sorted(
+            range(len(self.fields)), key=lambda i: self.fields[i].start
+        )
+        codes = ["<"]
+        self.converters = []
+        self.column_converters = []
+        # (struct, start, converter) of every field for `decode_field`
+        self.items = [None] * len(self.fields)
+        pos = 0
+        for i in ordered:
+            field = self.fields[i]
+            if field.start < pos:
+                raise ValueError(
+                    "[%s] field overlaps previous field" % field.name
+                )
+            if field.start > pos:
+                codes.append("%dx" % (field.start - pos))
+
+            code = field.struct_code
+            if code is None or struct.calcsize("<" + code) == field.length:
+                code = code or "%ds" % field.length
+                converter = field.make_decoder(encoding)
+                column_converter = field.make_column_decoder(encoding)
+            else:
+                # unusual field length, use the generic field decoder
+                code = "%ds" % field.length
+                converter = functools.partial(field.decode, encoding=encoding)
+                column_converter = None
+            codes.append(code)
+            self.converters.append(converter)
+            self.column_converters.append(column_converter)
+            self.items[i] = (struct.Struct("<" + code), field.start, converter)
+            pos = field.start + field.length
+
+        self.struct = struct.Struct("".join(codes))
+        # fields in the order of ``struct`` values and ``converters``
+        self.packed_fields = [self.fields[i] for i in ordered]
+
+        if ordered == list(range(len(ordered))):
+            self.order = None
+        else:
+            # position of each requested field in the unpacked tuple
+            self.order = [ordered.index(i) for i in range(len(ordered))]
+
+    def decode(self, buffer, offset=0):
+        """Return list of field values decoded from ``buffer``.
+
+        ``buffer`` is any bytes-like object (bytes, memoryview, mmap)
+        holding the record at the ``offset``.
+        """
+        values = [
+            value if converter is None else converter(value)
+            for (converter, value) in zip(
+                self.converters, self.struct.unpack_from(buffer, offset)
+            )
+        ]
+        if self.order is not None:
+            values = [values[i] for i in self.order]
+        return values
+
+    def decode_columns(self, buffer, record_length, ignore_errors=False):
+        """Return list of columns decoded from a block of records.
+
+        ``buffer`` holds consecutive records of ``record_length`` bytes.
+        Every column is an ``array.array`` when the field has an
+        ``array_code``, or a list otherwise. Columns are decoded by the
+        bulk field decoders (see `columns`) where available.
+
+        If ``ignore_errors`` is set, a column failing to decode is
+        decoded value by value into a list, with ``INVALID_VALUE``
+        for the values failing to decode.
+        """
+        unpacker = self.struct
+        if unpacker.size != record_length:
+            unpacker = struct.Struct(
+                unpacker.format + "%dx" % (record_length - unpacker.size)
+            )
+        columns = list(zip(*unpacker.iter_unpack(buffer)))
+        if not columns:
+            columns = [()] * len(self.converters)
+
+        result = []
+        for (field, converter, column_converter, column) in zip(
+            self.packed_fields, self.converters, self.column_converters,
+            columns
+        ):
+            try:
+                result.append(self._decode_column(
+                    field, converter, column_converter, column
+                ))
+            except Exception:
+                if not ignore_errors:
+                    raise
+                result.append([
+                    _decode_value(converter, value) for value in column
+                ])
+        if self.order is not None:
+            result = [result[i] for i in self.order]
+        return result
+
+    @staticmethod
+    def _decode_column(field, converter, column_converter, column):
+        """Return column of values decoded from raw ``column``."""
+        if column_converter is not None:
+            return column_converter(column)
+        if converter is not None:
+            column = map(converter, column)
+        if field.array_code is None:
+            return list(column)
+        return array.array(field.array_code, column)
+
+    def decode_field(self, buffer, index, offset=0):
+        """Return value of the field number ``index`` only.
+
+        ``index`` is the position of the field in the ``fields`` list.
+        """
+        (unpacker, start, converter) = self.items[index]
+        value = unpacker.unpack_from(buffer, offset + start)[0]
+        return value if converter is None else converter(value)
+
+    def decode_fields(self, buffer, offset=0, invalid=None):
+        """Return list of values decoded field by field.
+
+        Fields failing to decode get the ``invalid`` value. Slower
+        than `decode`; used when `decode` fails.
+        """
+        values = []
+        for index in range(len(self.items)):
+            try:
+                values.append(self.decode_field(buffer, index, offset))
+            except Exception:
+                values.append(invalid)
+        return values
+
+    __call__ = decode
+
+
+class DbfRecordEncoder(object):
+    """Record encoder compiled for the record fields.
+
+    Write-side twin of the `DbfRecordDecoder`. Instances are created
+    by `header.DbfHeader.encoder` and must be recreated when the layout
+    or the code page changes.
+
+    """
+
+    __slots__ = (
+        "fields", "struct", "converters", "order", "record_length",
+        "positions", "defaults",
+    )
+
+    def __init__(self, fields, record_length, encoding):
+        """Initialize instance.
+
+        Arguments:
+            fields:
+                sequence of all record `DbfField` definitions.
+            record_length:
+                size of the record including the deletion flag.
+            encoding:
+                encoding of the character data.
+
+        """
+        self.fields = list(fields)
+        self.record_length = record_length
+
+        ordered = sorted(
+            range(len(self.fields)), key=lambda i: self.fields[i].start
+        )
+        # deletion flag goes first
+        codes = ["<c"]
+        self.converters = []
+        pos = 1
+        for i in ordered:
+            field = self.fields[i]
+            if field.start < pos:
+                raise ValueError(
+                    "[%s] field overlaps previous field" % field.name
+                )
+            if field.start > pos:
+                codes.append("%dx" % (field.start - pos))
+
+            code = field.struct_code
+            if code is None:
+                code = "%ds" % field.length
+                converter = field.make_encoder(encoding)
+            elif struct.calcsize("<" + code) == field.length:
+                converter = field.make_encoder(encoding)
+            else:
+                # unusual field length, use the generic field encoder
+                code = "%ds" % field.length
+                converter = functools.partial(field.encode, encoding=encoding)
+            codes.append(code)
+            self.converters.append(converter)
+            pos = field.start + field.length
+
+        if record_length > pos:
+            codes.append("%dx" % (record_length - pos))
+
+        self.struct = struct.Struct("".join(codes))
+        self.order = None if ordered == list(range(len(ordered))) else ordered
+
+        # for `values`: field positions by bytes and str names
+        self.defaults = [field.default_value for field in self.fields]
+        self.positions = {}
+        for (index, field) in enumerate(self.fields):
+            self.positions[field.name] = index
+            self.positions[field.name.decode(encoding)] = index
+
+    def values(self, row):
+        """Return list of field values for the ``row``.
+
+        ``row`` is a sequence of values in the field order or a mapping
+        of field names (str or bytes, any case) to values; fields missing
+        in the mapping get default values.
+        """
+        if not hasattr(row, "items"):
+            return row
+        values = list(self.defaults)
+        for (name, value) in row.items():
+            index = self.positions.get(name)
+            if index is None:
+                index = self.positions.get(name.upper())
+                if index is None:
+                    raise KeyError('Field not found: {}'.format(name))
+            values[index] = value
+        return values
+
+    def _pack_args(self, values, deleted):
+        """Return arguments for the ``self.struct.pack`` call."""
+        if self.order is not None:
+            values = [values[i] for i in self.order]
+        args = [(b" ", b"*")[bool(deleted)]]
+        args.extend([
+            converter(value)
+            for (converter, value) in zip(self.converters, values)
+        ])
+        return args
+
+    def encode(self, values, deleted=False):
+        """Return bytes of the record encoded from ``values``."""
+        return self.struct.pack(*self._pack_args(values, deleted))
+
+    def encode_into(self, buffer, offset, values, deleted=False):
+        """Encode record straight into the writable ``buffer``.
+
+        ``buffer`` (e.g. preallocated ``bytearray``) must have at least
+        ``record_length`` bytes after the ``offset``.
+        """
+        self.struct.pack_into(buffer, offset, *self._pack_args(values, deleted))
+
+    __call__ = encode
+
+# vim: et sts=4 sw=4 :
@@ -0,0 +1,38 @@
+"""Bulk decoders for columns of raw field values.
+
+Used by `codec.DbfRecordDecoder.decode_columns`: a column is a sequence
+of raw values of one field unpacked from a block of records, and every
+function parses the whole column in one pass, falling back to the single
+value decoder for anything the fast path can't handle.
+
+"""
+
+__all__ = ["decode_numeric", "decode_date"]
+
+import array
+
+
+def decode_numeric(values, decode):
+    """Return ``array('d')`` of numbers parsed from raw ASCII ``values``.
+
+    ``float`` accepts bytes with surrounding spaces, so the common case
+    is parsed without stripping or decoding every value. ``decode`` is
+    the single value decoder used when the fast path fails (blank or
+    NUL-padded values).
+    """
+    try:
+        return array.array("d", map(float, values))
+    except ValueError:
+        return array.array("d", map(decode, values))
+
+
+def decode_date(values, decode):
+    """Return list of dates decoded from raw "yyyymmdd" ``values``.
+
+    Date columns have few distinct values, so every distinct value
+    is decoded once with ``decode`` and the result is mapped back.
+    """
+    decoded = dict([(value, decode(value)) for value in set(values)])
+    return list(map(decoded.__getitem__, values))
+
+# vim: et sts=4 sw=4 :
@@ -37,6 +37,12 @@ Examples:
         dbf.close()
 
 """
+import collections
+import datetime
+import os
+import shutil
+import struct
+import tempfile
 from io import IOBase
 
 __version__ = "$Revision: 1.9 $"[11:-2]
@@ -46,9 +52,15 @@ __author__ = "Jeff Kunce <kuncej@mail.conservation.state.mo.us>"
 __all__ = ["Dbf"]
 
 from .header import DbfHeader
+from .codec import DbfRecordDecoder
 from . import memo
 from .record import DbfRecord
+from .batch import RecordBatch
+from . import arrays
+from . import parallel
+from . import query
 from . import utils
+from . import vacuum
 
 
 class Dbf(object):
@@ -60,14 +72,21 @@ class Dbf(object):
 
     """
 
-    __slots__ = ("name", "header", "stream", "memo", "close_stream", "_ignore_errors")
+    __slots__ = (
+        "name", "header", "stream", "memo", "close_stream", "_ignore_errors",
+        "_mmap", "lazy", "write_buffer", "_pending",
+    )
 
     INVALID_VALUE = utils.INVALID_VALUE
 
+    # approximate size (in bytes) of the read buffer used by sequential scans
+    BUFFER_SIZE = 1 << 16
+
     ## initialization and creation helpers
 
     def __init__(self, file, read_only=False, new=False, ignore_errors=False,
-                 memo_file=None):
+                 memo_file=None, mmap=False, lazy=False, write_buffer=0,
+                 memo_cache=0):
         """Initialize instance.
 
         Arguments:
@@ -87,8 +106,25 @@ class Dbf(object):
             memo_file:
                 optional path to the FPT (memo fields) file.
                 Default is generated from the DBF file name.
+            mmap:
+                if set, the table (and the memo file) is memory-mapped
+                and records are sliced out of the map instead of being
+                read from the stream. Requires ``read_only`` mode.
+            lazy:
+                if set, returned records are lazy: fields are
+                decoded on first access (see `DbfRecord`).
+            write_buffer:
+                if set, up to ``write_buffer`` written records are kept
+                in memory and written on `flush` (or when the buffer is
+                full); records with adjacent indexes are written with
+                a single write call. Reads see the buffered records.
+            memo_cache:
+                number of memo values kept in the memo file cache
+                of the least recently read blocks; see `memo.MemoFile`.
 
         """
+        if mmap and (new or not read_only):
+            raise ValueError("mmap is supported in read-only mode only")
 
         # close self.stream when self.close() ? does not close
         # when file argument is a stream
@@ -119,15 +155,24 @@ class Dbf(object):
         else:
             self.header = DbfHeader.parse(self.stream)
 
+        self._mmap = utils.map_stream(self.stream) if mmap else None
+
         # for IDE inspection
         self._ignore_errors = None
 
+        self.lazy = lazy
+        self.write_buffer = write_buffer
+        # record index -> record data not written yet
+        self._pending = {}
+
         self.ignore_errors = ignore_errors
         if memo_file:
-            self.memo = memo.MemoFile(memo_file, readOnly=read_only, new=new)
+            self.memo = memo.MemoFile(memo_file, readOnly=read_only, new=new,
+                                      mmap=mmap, cache_size=memo_cache)
         elif self.header.has_memo:
             self.memo = memo.MemoFile(memo.MemoFile.memo_file_name(self.name),
-                                      readOnly=read_only, new=new)
+                                      readOnly=read_only, new=new, mmap=mmap,
+                                      cache_size=memo_cache)
         else:
             self.memo = None
         self.header.set_memo_file(self.memo)
@@ -165,6 +210,130 @@ class Dbf(object):
         """Update `ignore_errors` flag on the header object and self"""
         self.header.ignore_errors = self._ignore_errors = bool(value)
 
+    ## internal methods
+
+    def _read(self, position, size):
+        """Return ``size`` bytes of the table starting at ``position``.
+
+        Buffered records (see ``write_buffer``) overlay the data read
+        from the stream.
+        """
+        if self._mmap is not None:
+            data = self._mmap[position:position + size]
+        else:
+            self.stream.seek(position)
+            data = self.stream.read(size)
+        if self._pending:
+            data = self._overlay_pending(position, size, data)
+        return data
+
+    def _overlay_pending(self, position, size, data):
+        """Return ``data`` read at ``position`` with buffered records."""
+        header = self.header
+        record_length = header.record_length
+        first = (position - header.header_length) // record_length
+        stop = (position + size - header.header_length + record_length - 1) \
+            // record_length
+        if len(self._pending) < stop - first:
+            indexes = [i for i in self._pending if first <= i < stop]
+        else:
+            indexes = [i for i in range(first, stop) if i in self._pending]
+        if not indexes:
+            return data
+
+        data = bytearray(data)
+        for index in indexes:
+            start = header.header_length + index * record_length - position
+            low = max(start, 0)
+            high = min(start + record_length, size)
+            if len(data) < high:
+                # record appended after the end of the stream
+                data.extend(bytes(high - len(data)))
+            data[low:high] = self._pending[index][low - start:high - start]
+        return bytes(data)
+
+    def _flush_pending(self):
+        """Write buffered records, coalescing adjacent ones."""
+        pending = self._pending
+        self._pending = {}
+        header = self.header
+        indexes = sorted(pending)
+        first = 0
+        for (number, index) in enumerate(indexes, 1):
+            if number < len(indexes) and indexes[number] == index + 1:
+                # run of adjacent records continues
+                continue
+            self.stream.seek(
+                header.header_length + indexes[first] * header.record_length
+            )
+            self.stream.write(b"".join(
+                [pending[i] for i in indexes[first:number]]
+            ))
+            first = number
+
+    def _iter_chunks(self, start, stop, buffer_records):
+        """Yield ``(index, data)`` pairs of raw record buffers.
+
+        Every ``data`` holds up to ``buffer_records`` complete records
+        read with a single ``read`` call, ``index`` is the index of
+        the first record in the buffer.
+        """
+        record_count = self.header.record_count
+        record_length = self.header.record_length
+        stop = record_count if stop is None else min(stop, record_count)
+        if buffer_records is None:
+            buffer_records = max(1, self.BUFFER_SIZE // record_length)
+        elif buffer_records <= 0:
+            raise ValueError("buffer_records must be a positive integer")
+
+        index = start
+        while index < stop:
+            count = min(buffer_records, stop - index)
+            data = self._read(
+                self.header.header_length + index * record_length,
+                count * record_length
+            )
+            # ignore incomplete record at the end of truncated file
+            count = len(data) // record_length
+            if not count:
+                break
+            yield index, data[:count * record_length]
+            index += count
+
+    def _iter_records(self, start, stop, buffer_records, skip_deleted):
+        """Yield `DbfRecord` instances; see `scan`."""
+        header = self.header
+        record_length = header.record_length
+        for index, data in self._iter_chunks(start, stop, buffer_records):
+            for offset in range(0, len(data), record_length):
+                # 0x2A is "*", the deletion flag
+                if skip_deleted and data[offset] == 0x2A:
+                    continue
+                record = DbfRecord(
+                    header, index=index + offset // record_length,
+                    lazy=self.lazy
+                )
+                record.read(data[offset:offset + record_length])
+                yield record
+
+    def _iter_values(self, decoder, start, stop, buffer_records,
+                     skip_deleted):
+        """Yield lists of values decoded with ``decoder``; see `scan`."""
+        record_length = self.header.record_length
+        for index, data in self._iter_chunks(start, stop, buffer_records):
+            for offset in range(0, len(data), record_length):
+                if skip_deleted and data[offset] == 0x2A:
+                    continue
+                try:
+                    values = decoder.decode(data, offset)
+                except Exception:
+                    if not self.header.ignore_errors:
+                        raise
+                    values = decoder.decode_fields(
+                        data, offset, utils.INVALID_VALUE
+                    )
+                yield values
+
     ## interface methods
 
     def close(self):
@@ -180,11 +349,20 @@ class Dbf(object):
             self.stream.write(b"\x1A")
             self.stream.truncate()
 
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+        if self.memo:
+            self.memo.close()
+
         if self.close_stream:
             self.stream.close()
 
     def flush(self):
         """Flush data to the associated stream."""
+        if self._pending:
+            self._flush_pending()
         self.header.flush(self.stream)
         self.stream.flush()
         # flush if memo is not None
@@ -208,16 +386,166 @@ class Dbf(object):
             # we must increase record count before set index,
             # because set index will raise error if out of range
             self.header.record_count += 1
+            self.header.changed = True
             record.index = self.header.record_count - 1
 
-        self.stream.seek(record.position)
-        self.stream.write(record.to_bytes())
+        if self.write_buffer:
+            self._pending[record.index] = record.to_bytes()
+            if len(self._pending) >= self.write_buffer:
+                self._flush_pending()
+        else:
+            self.stream.seek(record.position)
+            self.stream.write(record.to_bytes())
 
     def append(self, record):
         """Append ``record`` to the database."""
         record.index = None
         self.write_record(record)
 
+    def append_many(self, rows, batch_records=None):
+        """Append ``rows`` to the database, return number of records.
+
+        Every row may be a `DbfRecord`, a sequence of field values
+        (in the order of the fields) or a mapping of field names to
+        values (missing fields get default values). Rows are encoded
+        into a buffer of ``batch_records`` records (default is about
+        `BUFFER_SIZE` bytes) written with a single write call; the
+        record count is updated once, after all rows are written.
+        Indexes of appended `DbfRecord` instances are not changed.
+        """
+        if not self.stream.writable():
+            raise OSError('Stream is not writable')
+
+        header = self.header
+        encoder = header.encoder
+        record_length = header.record_length
+        if batch_records is None:
+            batch_records = max(1, self.BUFFER_SIZE // record_length)
+        buffer = bytearray(batch_records * record_length)
+        count = offset = 0
+        self.stream.seek(
+            header.header_length + header.record_count * record_length
+        )
+        for row in rows:
+            if isinstance(row, DbfRecord):
+                buffer[offset:offset + record_length] = row.to_bytes()
+            else:
+                encoder.encode_into(buffer, offset, encoder.values(row))
+            count += 1
+            offset += record_length
+            if offset == len(buffer):
+                self.stream.write(buffer)
+                offset = 0
+        if offset:
+            self.stream.write(memoryview(buffer)[:offset])
+
+        header.record_count += count
+        header.changed = True
+        return count
+
+    extend = append_many
+
+    def update_field(self, index, name, value):
+        """Set field ``name`` of the record ``index`` to ``value``.
+
+        Only the field value is encoded and written in place, if it
+        differs from the stored one; other fields of the record are
+        neither read nor rewritten. Memo values are rewritten in place
+        if the memo file allows it (see `memo.MemoFile.reuse_blocks`).
+        Return True if the field value is changed.
+        """
+        if not self.stream.writable():
+            raise OSError('Stream is not writable')
+        if not 0 <= index < self.header.record_count:
+            raise IndexError("Record index out of range")
+        if self._pending:
+            self._flush_pending()
+
+        header = self.header
+        field = header[name]
+        position = header.header_length + index * header.record_length + \
+            field.start
+        old = self._read(position, field.length)
+        (raw, changed) = self._encode_field(field, old, 0, value,
+                                            header.code_page.encoding)
+        if raw != old:
+            # memo values rewritten in place keep the block number
+            self.stream.seek(position)
+            self.stream.write(raw)
+        return changed
+
+    def update_column(self, name, values, buffer_records=None,
+                      skip_deleted=True):
+        """Update field ``name`` of many records, return number of changes.
+
+        ``values`` is a mapping of record indexes to new values, or
+        a function called with the current (decoded) field value of
+        every record (except deleted ones if ``skip_deleted`` is set)
+        and returning the new value. Only the field values are encoded;
+        records are changed only if the new value differs from the
+        stored one.
+        """
+        if not self.stream.writable():
+            raise OSError('Stream is not writable')
+        header = self.header
+        field = header[name]
+        encoding = header.code_page.encoding
+        record_length = header.record_length
+
+        if hasattr(values, "items"):
+            return sum([
+                self.update_field(index, name, value)
+                for (index, value) in sorted(values.items())
+            ])
+
+        if self._pending:
+            self._flush_pending()
+        decode = DbfRecordDecoder([field], encoding).decode_field
+        changed = 0
+        for (index, data) in self._iter_chunks(0, None, buffer_records):
+            data = bytearray(data)
+            first = last = None
+            for offset in range(0, len(data), record_length):
+                if skip_deleted and data[offset] == 0x2A:
+                    continue
+                pos = offset + field.start
+                (raw, is_changed) = self._encode_field(
+                    field, data, pos, values(decode(data, 0, offset)),
+                    encoding
+                )
+                changed += is_changed
+                if data[pos:pos + field.length] != raw:
+                    data[pos:pos + field.length] = raw
+                    if first is None:
+                        first = pos
+                    last = pos + field.length
+            if first is not None:
+                self._write_span(index, data, first, last)
+        return changed
+
+    @staticmethod
+    def _encode_field(field, data, start, value, encoding):
+        """Return ``(raw, changed)`` of ``value`` for ``data[start:]``.
+
+        ``raw`` is the encoded ``value`` of the ``field`` stored at
+        ``data[start:]``, ``changed`` tells if the value differs from
+        the stored one. Memo fields replace the old value, see
+        `fields.DbfGeneralField.encode_update`.
+        """
+        old = bytes(data[start:start + field.length])
+        if field.is_memo:
+            return field.encode_update(old, value, encoding)
+        raw = field.encode(value, encoding)
+        return (raw, raw != old)
+
+    def _write_span(self, index, data, start, stop):
+        """Write ``data[start:stop]`` of the chunk read at record ``index``."""
+        header = self.header
+        self.stream.seek(
+            header.header_length + index * header.record_length + start
+        )
+        self.stream.write(memoryview(data)[start:stop])
+
     def add_field(self, *defs):
         """Add field definitions.
 
@@ -230,6 +558,543 @@ class Dbf(object):
                     memo.MemoFile.memo_file_name(self.name), new=True)
             self.header.set_memo_file(self.memo)
 
+    def scan(self, start=0, stop=None, buffer_records=None, fields=None,
+             skip_deleted=False):
+        """Iterate over `DbfRecord` instances in file order.
+
+        Records are read in chunks of ``buffer_records`` records
+        (default is about `BUFFER_SIZE` bytes) and sliced out of
+        the buffer, so only one read is done per chunk.
+
+        Arguments:
+            start:
+                index of the first record to read.
+            stop:
+                index of the record to stop at (exclusive);
+                None means the end of the table.
+            buffer_records:
+                number of records read at once.
+            fields:
+                optional list of field names. If set, lists of
+                these field values are returned instead of records
+                (see `iter_columns`).
+            skip_deleted:
+                if set, deleted records are skipped; the deletion
+                flag is checked before anything is decoded.
+
+        """
+        if fields is not None:
+            return self.iter_columns(
+                fields, start, stop, buffer_records, skip_deleted
+            )
+        return self._iter_records(start, stop, buffer_records, skip_deleted)
+
+    def iter_columns(self, fields, start=0, stop=None, buffer_records=None,
+                     skip_deleted=False):
+        """Iterate over lists of the ``fields`` values in file order.
+
+        Only the named fields are decoded, other fields (including
+        memo fields) are skipped without reading the memo file.
+        Other arguments are the same as for `scan`.
+        """
+        return self._iter_values(
+            self.header.decoder_for(fields),
+            start, stop, buffer_records, skip_deleted
+        )
+
+    def iter_tuples(self, fields=None, named=False, start=0, stop=None,
+                    buffer_records=None, skip_deleted=False):
+        """Iterate over tuples of field values in file order.
+
+        No `DbfRecord` objects are created. If ``named`` is set,
+        rows are instances of a ``namedtuple`` class built once for
+        the table fields (invalid identifiers are renamed to ``_N``).
+        ``fields`` is an optional list of the field names to decode,
+        other arguments are the same as for `scan`.
+        """
+        header = self.header
+        decoder = header.decoder if fields is None \
+            else header.decoder_for(fields)
+        if named:
+            make = collections.namedtuple("Row", [
+                field.name.decode(header.code_page.encoding)
+                for field in decoder.fields
+            ], rename=True)._make
+        else:
+            make = tuple
+        for values in self._iter_values(
+                decoder, start, stop, buffer_records, skip_deleted):
+            yield make(values)
+
+    def iter_dicts(self, fields=None, start=0, stop=None,
+                   buffer_records=None, skip_deleted=False):
+        """Iterate over dictionaries of field values in file order.
+
+        Keys are the field names, as in `DbfRecord.as_dict`.
+        Arguments are the same as for `iter_tuples`.
+        """
+        header = self.header
+        decoder = header.decoder if fields is None \
+            else header.decoder_for(fields)
+        names = [field.name for field in decoder.fields]
+        for values in self._iter_values(
+                decoder, start, stop, buffer_records, skip_deleted):
+            yield dict(zip(names, values))
+
+    def select(self, where, start=0, stop=None, buffer_records=None,
+               skip_deleted=False):
+        """Iterate over `DbfRecord` instances matching ``where``.
+
+        ``where`` is a mapping of field names to `query.Predicate`
+        instances or plain values (tested for equality). Predicates are
+        checked on the raw record data, so only matching records are
+        decoded. Other arguments are the same as for `scan`.
+
+        Examples:
+            table.select({"NAME": query.Prefix("Jo"), "MEMBER": True})
+
+        """
+        header = self.header
+        check = query.compile_where(header, where)
+        record_length = header.record_length
+        for (index, data) in self._iter_chunks(start, stop, buffer_records):
+            for offset in range(0, len(data), record_length):
+                if skip_deleted and data[offset] == 0x2A:
+                    continue
+                if check(data, offset):
+                    record = DbfRecord(
+                        header, index=index + offset // record_length,
+                        lazy=self.lazy
+                    )
+                    record.read(data[offset:offset + record_length])
+                    yield record
+
+    def update_where(self, where, assignments, buffer_records=None,
+                     skip_deleted=True):
+        """Assign field values in records matching ``where``.
+
+        ``where`` is the same as for `select`, ``assignments`` is
+        a mapping of field names to new values or to functions called
+        with the current field value and returning the new one. Plain
+        values (except memo values) are encoded once; records aren't
+        decoded, only the assigned fields are written back. Return
+        number of matched records.
+
+        Examples:
+            table.update_where({"STATUS": "N"}, {"STATUS": "P"})
+
+        """
+        if not self.stream.writable():
+            raise OSError('Stream is not writable')
+        header = self.header
+        encoding = header.code_page.encoding
+        record_length = header.record_length
+        check = query.compile_where(header, where)
+        if self._pending:
+            self._flush_pending()
+        updates = []
+        for (name, value) in assignments.items():
+            field = header[name]
+            if callable(value):
+                decode = DbfRecordDecoder([field], encoding).decode_field
+                updates.append((field, None, decode, value))
+            elif field.is_memo:
+                # every record gets its own memo blocks
+                updates.append((field, None, None, value))
+            else:
+                raw = field.encode(value, encoding)
+                updates.append((field, raw, None, None))
+
+        matched = 0
+        for (index, data) in self._iter_chunks(0, None, buffer_records):
+            data = bytearray(data)
+            first = last = None
+            for offset in range(0, len(data), record_length):
+                if skip_deleted and data[offset] == 0x2A:
+                    continue
+                if not check(data, offset):
+                    continue
+                matched += 1
+                for (field, raw, decode, value) in updates:
+                    start = offset + field.start
+                    stop = start + field.length
+                    if raw is None:
+                        if decode is not None:
+                            value = value(decode(data, 0, offset))
+                        raw = self._encode_field(
+                            field, data, start, value, encoding
+                        )[0]
+                    if data[start:stop] != raw:
+                        data[start:stop] = raw
+                        if first is None or start < first:
+                            first = start
+                        if last is None or stop > last:
+                            last = stop
+            if first is not None:
+                self._write_span(index, data, first, last)
+        return matched
+
+    def delete_where(self, where, buffer_records=None):
+        """Mark records matching ``where`` deleted, return their number.
+
+        ``where`` is the same as for `select`. Records aren't decoded;
+        deletion flags are set in the chunk buffer and written with
+        a single write per chunk.
+        """
+        if not self.stream.writable():
+            raise OSError('Stream is not writable')
+        header = self.header
+        check = query.compile_where(header, where)
+        if self._pending:
+            self._flush_pending()
+        record_length = header.record_length
+        deleted = 0
+        for (index, data) in self._iter_chunks(0, None, buffer_records):
+            data = bytearray(data)
+            first = last = None
+            for offset in range(0, len(data), record_length):
+                if data[offset] != 0x2A and check(data, offset):
+                    data[offset] = 0x2A
+                    if first is None:
+                        first = offset
+                    last = offset + 1
+                    deleted += 1
+            if first is not None:
+                self._write_span(index, data, first, last)
+        return deleted
+
+    def live_count(self, buffer_records=None):
+        """Return number of records which are not deleted.
+
+        Only the deletion flags are inspected: every buffer of
+        records is sliced with the record length stride.
+        """
+        record_length = self.header.record_length
+        count = 0
+        for (index, data) in self._iter_chunks(0, None, buffer_records):
+            flags = data[0::record_length]
+            count += len(flags) - flags.count(b"*")
+        return count
+
+    def memo_blocks(self, buffer_records=None):
+        """Yield memo block numbers of all records, zeros included.
+
+        Pointers of all memo fields of all records (deleted ones too)
+        are read from the raw record data. Use to rebuild the free
+        block map of the memo file:
+
+            table.memo.reuse_blocks = True
+            table.memo.rebuild_free_map(table.memo_blocks())
+
+        """
+        header = self.header
+        record_length = header.record_length
+        unpackers = [
+            struct.Struct("<%dxL" % field.start).unpack_from
+            for field in header.fields if field.is_memo
+        ]
+        for (index, data) in self._iter_chunks(0, None, buffer_records):
+            for offset in range(0, len(data), record_length):
+                for unpack in unpackers:
+                    yield unpack(data, offset)[0]
+
+    def pack(self, memo=False, buffer_records=None):
+        """Remove deleted records, return the number of removed records.
+
+        Live records are moved towards the start of the file in large
+        chunks of raw data, without decoding, and the file is truncated.
+
+        If ``memo`` is set, the memo file is compacted too,
+        see `vacuum_memo`.
+        """
+        if not self.stream.writable():
+            raise OSError('Stream is not writable')
+        if self._pending:
+            self._flush_pending()
+        header = self.header
+        record_length = header.record_length
+        if memo and self.memo and not self.memo.close_stream:
+            raise ValueError("memo file must be opened by name")
+
+        count = 0
+        for (index, data) in self._iter_chunks(0, None, buffer_records):
+            live = [
+                data[offset:offset + record_length]
+                for offset in range(0, len(data), record_length)
+                if data[offset] != 0x2A
+            ]
+            if count == index and len(live) * record_length == len(data):
+                # nothing moved
+                count += len(live)
+                continue
+            self.stream.seek(header.header_length + count * record_length)
+            self.stream.write(b"".join(live))
+            count += len(live)
+
+        removed = header.record_count - count
+        self.stream.seek(header.header_length + count * record_length)
+        # write SUB (ASCII 26) after last record
+        self.stream.write(b"\x1A")
+        self.stream.truncate()
+        if removed:
+            header.record_count = count
+            header.changed = True
+        self.flush()
+        if memo and self.memo:
+            self.vacuum_memo(buffer_records)
+        return removed
+
+    def vacuum_memo(self, buffer_records=None, run_size=vacuum.RUN_SIZE):
+        """Drop unreferenced memo values, return number of kept values.
+
+        Values referenced by the records (deleted ones too) are copied
+        as raw blocks, in the order of their block numbers, to a new
+        memo file next to the old one. Record pointers are rewritten
+        in place and the new memo file replaces the old one. Memory
+        usage is bounded by ``run_size`` block numbers; see `vacuum`.
+        Requires memo file opened by name.
+        """
+        if not self.memo:
+            return 0
+        return vacuum.vacuum_memo(self, buffer_records, run_size)
+
+    def alter(self, add=(), drop=(), resize=None, buffer_records=None):
+        """Change the structure of a populated table.
+
+        The table is rewritten in one pass into a temporary file
+        which then replaces the table file; requires table opened
+        by name.
+
+        Arguments:
+            add:
+                list of new field definitions, see `add_field`. New
+                fields are appended and filled with default values
+                (empty for memo fields).
+            drop:
+                list of names of the fields to remove.
+            resize:
+                mapping of field names to new lengths or to
+                ``(length, decimal_count)`` pairs.
+            buffer_records:
+                number of records processed at once.
+
+        Values of the unchanged fields are copied verbatim,
+        only values of the resized fields are decoded and encoded.
+
+        Examples:
+            table.alter(
+                add=[("C", "EMAIL", 40)],
+                drop=["FAX"],
+                resize={"NAME": 30, "PRICE": (10, 2)},
+            )
+
+        """
+        if not self.close_stream:
+            raise ValueError("table must be opened by name")
+        if not self.stream.writable():
+            raise OSError('Stream is not writable')
+        self.flush()
+        header = self.header
+        encoding = header.code_page.encoding
+        drop = set([header[name].name for name in drop])
+        resize = dict([
+            (header[name].name, size) for (name, size) in
+            (resize or {}).items()
+        ])
+
+        new = DbfHeader(
+            code_page=header.code_page, signature=header.signature,
+            flag=header.flag, ignore_errors=header.ignore_errors,
+        )
+        # (old field, new length, new decimal count) of the kept fields
+        kept = []
+        for field in header.fields:
+            if field.name in drop:
+                continue
+            size = resize.get(field.name, field.length)
+            if isinstance(size, int):
+                size = (size, field.decimal_count)
+            new.add_field((field.type_code, field.name) + tuple(size))
+            new.fields[-1].flag = field.flag
+            kept.append(field)
+        new.add_field(*add)
+        names = [field.name for field in new.fields]
+        if len(set(names)) != len(names):
+            raise ValueError("duplicate field names")
+        if new.has_memo and not self.memo:
+            self.memo = memo.MemoFile(
+                memo.MemoFile.memo_file_name(self.name), new=True
+            )
+        new.set_memo_file(self.memo)
+        new.record_count = header.record_count
+
+        # record layout: ("copy", start, stop) of the old record data,
+        # ("encode", field index) of the old field decoded and encoded,
+        # ("value", raw) of the new field
+        layout = [("copy", 0, 1)]
+        decoder = DbfRecordDecoder(kept, encoding)
+        for (index, field) in enumerate(new.fields):
+            if index >= len(kept):
+                if field.is_memo:
+                    raw = b"\x00" * field.length
+                else:
+                    raw = field.encode(field.default_value, encoding)
+                layout.append(("value", raw))
+            elif field.length != kept[index].length or \
+                    field.decimal_count != kept[index].decimal_count:
+                layout.append(("encode", index))
+            elif layout[-1][0] == "copy" and \
+                    layout[-1][2] == kept[index].start:
+                layout[-1] = ("copy", layout[-1][1],
+                              kept[index].start + field.length)
+            else:
+                layout.append(("copy", kept[index].start,
+                               kept[index].start + field.length))
+
+        record_length = header.record_length
+        new.last_update = datetime.date.today()
+        (handle, name) = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.name))
+        )
+        try:
+            with os.fdopen(handle, "w+b") as stream:
+                new.write(stream)
+                for (index, data) in self._iter_chunks(0, None, buffer_records):
+                    records = []
+                    for offset in range(0, len(data), record_length):
+                        for item in layout:
+                            if item[0] == "copy":
+                                records.append(
+                                    data[offset + item[1]:offset + item[2]]
+                                )
+                            elif item[0] == "value":
+                                records.append(item[1])
+                            else:
+                                records.append(new.fields[item[1]].encode(
+                                    decoder.decode_field(data, item[1], offset),
+                                    encoding
+                                ))
+                    stream.write(b"".join(records))
+                # write SUB (ASCII 26) after last record
+                stream.write(b"\x1A")
+            # mkstemp creates files readable by the owner only
+            shutil.copymode(self.name, name)
+        except Exception:
+            os.remove(name)
+            raise
+
+        self.stream.close()
+        try:
+            os.replace(name, self.name)
+        except Exception:
+            os.remove(name)
+            raise
+        else:
+            self.header = new
+        finally:
+            # new table, or the old one if it wasn't replaced
+            self.stream = open(self.name, "r+b")
+
+    def iter_batches(self, batch_size=65536, fields=None, start=0, stop=None):
+        """Iterate over `RecordBatch` instances of ``batch_size`` records.
+
+        Each batch is read with a single read call and decoded
+        column by column, without creating `DbfRecord` objects.
+
+        Arguments:
+            batch_size:
+                maximal number of records in a batch.
+            fields:
+                optional list of field names to decode;
+                all fields are decoded by default.
+            start, stop:
+                range of the record indexes, see `scan`.
+
+        If `ignore_errors` is set, values failing to decode are
+        ``INVALID_VALUE`` (the column is a list then).
+
+        """
+        header = self.header
+        if fields is None:
+            decoder = header.decoder
+        else:
+            decoder = header.decoder_for(fields)
+        record_length = header.record_length
+        for (index, data) in self._iter_chunks(start, stop, batch_size):
+            yield RecordBatch(
+                header, index, decoder.fields,
+                decoder.decode_columns(
+                    data, record_length, header.ignore_errors
+                ),
+                data[0::record_length],
+            )
+
+    def to_numpy(self, convert=True, skip_deleted=False):
+        """Return NumPy structured array of all records.
+
+        The whole record area is read at once and mapped onto
+        a structured dtype; see `arrays.to_numpy` for the arguments.
+        Requires NumPy.
+        """
+        data = self._read(
+            self.header.header_length,
+            self.header.record_count * self.header.record_length
+        )
+        return arrays.to_numpy(self.header, data, convert, skip_deleted)
+
+    def from_numpy(self, array):
+        """Append records from NumPy structured ``array``.
+
+        Records are encoded column by column (see `arrays.from_numpy`)
+        and written with a single write call. Requires NumPy.
+        """
+        if not self.stream.writable():
+            raise OSError('Stream is not writable')
+
+        data = arrays.from_numpy(self.header, array)
+        self.stream.seek(
+            self.header.header_length +
+            self.header.record_count * self.header.record_length
+        )
+        self.stream.write(data)
+        self.header.record_count += len(array)
+        self.header.changed = True
+
+    def _parallel_args(self):
+        """Flush pending changes, return (name, memo name) for workers."""
+        if not isinstance(self.name, str) or not self.name:
+            raise ValueError("parallel scans require a table opened by name")
+        if self.stream.writable():
+            self.flush()
+        return self.name, self.memo.name if self.memo else None
+
+    def parallel_map(self, func, workers=None, chunk_records=None):
+        """Yield ``func(record)`` for every record in file order.
+
+        Records are decoded in ``workers`` processes, each reopening the
+        table read-only with the same `ignore_errors` and `lazy` flags;
+        ``func`` must be picklable. For more information see
+        `parallel.parallel_map`.
+        """
+        (name, memo_name) = self._parallel_args()
+        return parallel.parallel_map(
+            name, self.header.record_count, func, workers, chunk_records,
+            memo_name, self.ignore_errors, self.lazy
+        )
+
+    def parallel_scan(self, func, workers=None):
+        """Return list of ``func(records)`` results, one per worker.
+
+        Every worker process calls ``func`` with an iterator over its
+        contiguous range of records and sends back the (reduced) result.
+        For more information see `parallel.parallel_scan`.
+        """
+        (name, memo_name) = self._parallel_args()
+        return parallel.parallel_scan(
+            name, self.header.record_count, func, workers, memo_name,
+            self.ignore_errors, self.lazy
+        )
+
     ## 'magic' methods (representation and sequence interface)
 
     def __str__(self):
@@ -239,15 +1104,22 @@ class Dbf(object):
         """Return number of records."""
         return self.record_count
 
+    def __iter__(self):
+        """Iterate over all records using buffered `scan`."""
+        return self.scan()
+
     def __getitem__(self, index):
         """Return `DbfRecord` instance."""
         if isinstance(index, slice):
             return [self[i] for i in range(self.record_count)[index]]
 
         record = DbfRecord(
-            self.header, index=index
+            self.header, index=index, lazy=self.lazy
         )
-        record.read(self.stream)
+        data = self._pending.get(record.index)
+        if data is None:
+            data = self._read(record.position, self.header.record_length)
+        record.read(data)
         return record
 
     def __setitem__(self, index, record):
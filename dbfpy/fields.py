@@ -13,11 +13,13 @@ __date__ = "$Date: 2010/12/14 11:04:49 $"[7:-2]
 __all__ = ['DbfField', 'DbfFields']
 
 import datetime
+import functools
 import struct
 import locale
 
 from .memo import MemoData
 from . import utils
+from . import columns
 from .code_page import CodePage
 
 
@@ -133,6 +135,14 @@ class DbfField(object):
     # True if field data is kept in the Memo file
     is_memo = False
 
+    # struct format code used by the compiled record codecs to unpack
+    # the field value (see `codec`). None means raw bytes of the field.
+    struct_code = None
+
+    # ``array.array`` type code for columns of decoded values
+    # (see `batch.RecordBatch`). None means values are kept in a list.
+    array_code = None
+
     def __init__(
         self, name, length=None, decimal_count=0, start=None,
         flag=0, ai_next=0, ai_step=0, ignore_errors=False,
@@ -232,6 +242,31 @@ class DbfField(object):
         """
         raise NotImplementedError
 
+    def make_decoder(self, encoding=None):
+        """Return a function converting unpacked value to the field value.
+
+        Used by the compiled record decoder (see `codec`); argument of
+        the returned function is the value unpacked with `struct_code`.
+        None means that unpacked value is returned as is.
+        """
+        return functools.partial(self.decode, encoding=encoding)
+
+    def make_column_decoder(self, encoding=None):
+        """Return a function decoding whole column of unpacked values.
+
+        Used by `codec.DbfRecordDecoder.decode_columns`. None means
+        that values are converted one by one with `make_decoder`.
+        """
+        return None
+
+    def make_encoder(self, encoding=None):
+        """Return a function converting field value to the packable value.
+
+        Used by the compiled record encoder (see `codec`); result of the
+        returned function is packed with `struct_code`.
+        """
+        return functools.partial(self.encode, encoding=encoding)
+
 
 ## real classes
 
@@ -248,17 +283,25 @@ class DbfCharacterField(DbfField):
         """
         return value.decode(encoding).rstrip(" ")
 
+    def make_decoder(self, encoding=locale.getpreferredencoding()):
+        return lambda value: value.decode(encoding).rstrip(" ")
+
     def encode(self, value, encoding=locale.getpreferredencoding()):
         """Return raw data string encoded from a ``value``."""
         value = str(value).encode(encoding)
         return value[:self.length].ljust(self.length)
 
+    def make_encoder(self, encoding=locale.getpreferredencoding()):
+        length = self.length
+        return lambda value: str(value).encode(encoding)[:length].ljust(length)
+
 
 class DbfNumericField(DbfField):
     """Definition of the numeric field."""
 
     type_code = b'N'
     default_value = 0.0
+    array_code = "d"
 
     def decode(self, value, encoding=locale.getpreferredencoding()):
         """Return a number decoded from ``value``.
@@ -285,6 +328,24 @@ class DbfNumericField(DbfField):
 
         return string.encode(encoding)
 
+    def make_column_decoder(self, encoding=locale.getpreferredencoding()):
+        return functools.partial(
+            columns.decode_numeric, decode=self.make_decoder(encoding)
+        )
+
+    def make_encoder(self, encoding=locale.getpreferredencoding()):
+        template = "%%%d.%df" % (self.length, self.decimal_count)
+        length = self.length
+
+        def encode(value):
+            string = template % value
+            if len(string) > length:
+                # overflow checks
+                return self.encode(value, encoding)
+            return string.encode(encoding)
+
+        return encode
+
 
 class DbfFloatField(DbfNumericField):
     """Definition of the float field - same as numeric."""
@@ -298,11 +359,19 @@ class DbfIntegerField(DbfField):
     type_code = b'I'
     fixed_length = 4
     default_value = 0
+    struct_code = "i"
+    array_code = "i"
 
     def decode(self, value, encoding=None):
         """Return an integer number decoded from ``value``."""
         return struct.unpack("<i", value)[0]
 
+    def make_decoder(self, encoding=None):
+        return None
+
+    def make_encoder(self, encoding=None):
+        return int
+
     def encode(self, value, encoding=None):
         """Return string containing encoded ``value``."""
         return struct.pack("<i", int(value))
@@ -314,6 +383,8 @@ class DbfCurrencyField(DbfField):
     type_code = b'Y'
     fixed_length = 8
     default_value = 0.0
+    struct_code = "q"
+    array_code = "d"
 
     @property
     def decimal_count(self):
@@ -327,6 +398,12 @@ class DbfCurrencyField(DbfField):
         """Return float number decoded from ``value``."""
         return struct.unpack("<q", value)[0] / 10000.
 
+    def make_decoder(self, encoding=None):
+        return lambda value: value / 10000.
+
+    def make_encoder(self, encoding=None):
+        return lambda value: round(value * 10000)
+
     def encode(self, value, encoding=None):
         """Return string containing encoded ``value``."""
         return struct.pack("<q", round(value * 10000))
@@ -339,6 +416,13 @@ class DbfLogicalField(DbfField):
     default_value = -1
     fixed_length = 1
 
+    # raw value -> decoded value, used by the compiled decoder
+    _values = dict(
+        [(b"?", -1)] +
+        [(bytes([c]), False) for c in b"NnFf "] +
+        [(bytes([c]), True) for c in b"YyTt"]
+    )
+
     def decode(self, value, encoding=None):
         """Return True, False or -1 decoded from ``value``."""
         # Note: value always is 1-char string
@@ -350,6 +434,17 @@ class DbfLogicalField(DbfField):
             return True
         raise ValueError("[%s] Invalid logical value %r" % (self.name, value))
 
+    def make_decoder(self, encoding=None):
+        values = self._values
+
+        def decode(value):
+            try:
+                return values[value]
+            except KeyError:
+                return self.decode(value)
+
+        return decode
+
     def encode(self, value, encoding=None):
         """Return a character from the "TF?" set.
 
@@ -374,31 +469,64 @@ class DbfGeneralField(DbfField):
     default_value = b"\x00" * 4
     fixed_length = 4
     is_memo = True
+    struct_code = "L"
     # MemoFile instance.  Must be set before reading or writing to the field.
     file = None
 
+    def read_block(self, block):
+        """Return MemoData stored in the memo ``block`` (0 means empty)."""
+        if block:
+            return self.file.read(block)
+        else:
+            return MemoData(b'', self.memoType)
+
     def decode(self, value, encoding=None):
         """Return MemoData instance containing field data."""
-        _block = struct.unpack("<L", value)[0]
-        if _block:
-            return self.file.read(_block)
+        return self.read_block(struct.unpack("<L", value)[0])
+
+    def make_decoder(self, encoding=None):
+        return self.read_block
+
+    def write_block(self, value):
+        """Write ``value`` to the memo file, return the block number.
+
+        Empty value is not written, 0 is returned.
+        """
+        if value:
+            return self.file.write(MemoData(value, self.memoType))
         else:
-            return MemoData(b'', self.memoType)
+            return 0
 
     def encode(self, value, encoding=None):
         """Return raw data string encoded from a ``value``.
 
         Note: this is an internal method.
         """
+        return struct.pack("<L", self.write_block(value))
+
+    def make_encoder(self, encoding=None):
+        return self.write_block
+
+    def encode_update(self, raw, value, encoding=None):
+        """Return ``(data, changed)`` of ``value`` replacing field ``raw``.
+
+        ``data`` is the new raw field data, ``changed`` is False if
+        the stored value equals ``value`` (nothing is written then).
+        Old memo blocks are rewritten or released for reuse if the
+        memo file allows it, see `MemoFile.rewrite`; the block number
+        of a value rewritten in place stays the same.
+        """
+        (block,) = struct.unpack("<L", raw)
         if value:
-            return struct.pack(
-                "<L",
-                self.file.write(
-                    MemoData(value, self.memoType)
-                )
-            )
+            if block and self.file.read(block) == value:
+                return (raw, False)
+            block = self.file.rewrite(block, MemoData(value, self.memoType))
+        elif block:
+            self.file.free(block)
+            block = 0
         else:
-            return self.default_value
+            return (raw, False)
+        return (struct.pack("<L", block), True)
 
 
 class DbfMemoField(DbfGeneralField):
@@ -411,6 +539,9 @@ class DbfMemoField(DbfGeneralField):
         """Return memo string."""
         return super().decode(value).decode(encoding)
 
+    def make_decoder(self, encoding=locale.getpreferredencoding()):
+        return lambda block: self.read_block(block).decode(encoding)
+
     def encode(self, value, encoding=locale.getpreferredencoding()):
         """Return raw data string encoded from a ``value``.
 
@@ -418,6 +549,13 @@ class DbfMemoField(DbfGeneralField):
         """
         return super().encode(value.encode(encoding))
 
+    def make_encoder(self, encoding=locale.getpreferredencoding()):
+        return lambda value: self.write_block(value.encode(encoding))
+
+    def encode_update(self, raw, value,
+                      encoding=locale.getpreferredencoding()):
+        return super().encode_update(raw, value.encode(encoding))
+
 
 class DbfPictureField(DbfGeneralField):
     """Definition of the picture field."""
@@ -446,6 +584,22 @@ class DbfDateField(DbfField):
         else:
             return None
 
+    def make_decoder(self, encoding=locale.getpreferredencoding()):
+        def decode(value):
+            # fast path for the common "yyyymmdd" case
+            if value.isdigit():
+                return datetime.date(
+                    int(value[:4]), int(value[4:6]), int(value[6:8])
+                )
+            return self.decode(value, encoding)
+
+        return decode
+
+    def make_column_decoder(self, encoding=locale.getpreferredencoding()):
+        return functools.partial(
+            columns.decode_date, decode=self.make_decoder(encoding)
+        )
+
     def encode(self, value, encoding=locale.getpreferredencoding()):
         """
         Return a string-encoded value.
@@ -461,6 +615,15 @@ class DbfDateField(DbfField):
         else:
             return b" " * self.length
 
+    def make_encoder(self, encoding=locale.getpreferredencoding()):
+        def encode(value):
+            # fast path for the common ``datetime.date`` case
+            if type(value) is datetime.date:
+                return b"%04d%02d%02d" % (value.year, value.month, value.day)
+            return self.encode(value, encoding)
+
+        return encode
+
 
 class DbfDateTimeField(DbfField):
     """Definition of the timestamp field."""
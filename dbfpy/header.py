@@ -17,6 +17,7 @@ import textwrap
 from .fields import DbfField, DbfFields
 from .utils import get_date
 from .code_page import CodePage
+from .codec import DbfRecordDecoder, DbfRecordEncoder
 
 
 class DbfHeader():
@@ -42,7 +43,8 @@ class DbfHeader():
 
     __slots__ = (
         "signature", "fields", "_last_update", "record_length", "record_count",
-        "header_length", "_changed", "flag", "_code_page", "_ignore_errors"
+        "header_length", "_changed", "flag", "_code_page", "_ignore_errors",
+        "_decoder", "_encoder",
     )
 
     ## instance construction and initialization methods
@@ -78,6 +80,7 @@ class DbfHeader():
         """
         # for IDE inspection
         self._ignore_errors = self._code_page = self._last_update = None
+        self._decoder = self._encoder = None
 
         self.signature = signature
         self.fields = list(fields) if fields is not None else []
@@ -113,11 +116,17 @@ class DbfHeader():
             code_page if isinstance(code_page, CodePage)
             else CodePage(code_page)
         )
+        # compiled codecs depend on the encoding
+        self._decoder = self._encoder = None
 
     @property
     def changed(self):
         return self._changed
 
+    @changed.setter
+    def changed(self, value):
+        self._changed = bool(value)
+
     @classmethod
     def parse(cls, stream):
         """Return header object from the stream."""
@@ -178,6 +187,34 @@ class DbfHeader():
         )
 
     ## properties
+    @property
+    def decoder(self):
+        """`codec.DbfRecordDecoder` compiled for the current fields."""
+        if self._decoder is None:
+            self._decoder = DbfRecordDecoder(
+                self.fields, self.code_page.encoding
+            )
+        return self._decoder
+
+    def decoder_for(self, names):
+        """Return `codec.DbfRecordDecoder` for the fields named ``names``.
+
+        Decoded values follow the order of ``names``; other fields
+        are skipped without being sliced or decoded.
+        """
+        return DbfRecordDecoder(
+            [self[name] for name in names], self.code_page.encoding
+        )
+
+    @property
+    def encoder(self):
+        """`codec.DbfRecordEncoder` compiled for the current fields."""
+        if self._encoder is None:
+            self._encoder = DbfRecordEncoder(
+                self.fields, self.record_length, self.code_page.encoding
+            )
+        return self._encoder
+
     @property
     def has_memo(self):
         """True if at least one field is a Memo field"""
@@ -329,6 +366,7 @@ class DbfHeader():
         # and now extend field definitions and
         # update record record_length
         self._calc_header_length()
+        self._decoder = self._encoder = None
         self._changed = True
 
     def write(self, stream):
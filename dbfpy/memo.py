@@ -6,12 +6,16 @@ __version__ = "$Revision: 1.3 $"[11:-2]
 __date__ = "$Date: 2010/12/15 08:08:23 $"[7:-2]
 
 # Note: the data class is exported for TYPE constants.
-__all__ = ["MemoFile", "MemoData"]
+__all__ = ["MemoFile", "MemoData", "MemoBlob"]
 
+import collections
+import io
 import os
 import struct
 import locale
 
+from . import utils
+
 class MemoData(bytes):
 
     """Data read from or written to Memo file.
@@ -33,17 +37,86 @@ class MemoData(bytes):
         _obj.type = type
         return _obj
 
+class MemoBlob(io.RawIOBase):
+
+    """Read-only file-like object of a single memo value.
+
+    Returned by `MemoFile.open_blob`.  Attribute ``type`` is the
+    value type (one of the `MemoData` TYPE_* constants).
+
+    """
+
+    def __init__(self, memo, position, length, type):
+        """Initialize instance.
+
+        Arguments:
+            memo:
+                `MemoFile` the value is read from.
+            position:
+                file position of the value data.
+            length:
+                length of the value, None if the value is
+                terminated with `MemoFile.EOT` (DBT files).
+            type:
+                value type.
+        """
+        super().__init__()
+        self.memo = memo
+        self.position = position
+        self.remaining = length
+        self.type = type
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """Read up to ``len(buffer)`` bytes into ``buffer``."""
+        _size = len(buffer)
+        if self.remaining == 0 or not _size:
+            return 0
+        if self.remaining is not None:
+            _size = min(_size, self.remaining)
+            _data = self.memo._read(self.position, _size)
+            self.remaining -= len(_data)
+            if len(_data) < _size:
+                # truncated file
+                self.remaining = 0
+        else:
+            # one more byte to see the terminator split by the chunk end
+            _data = self.memo._read(self.position, _size + 1)
+            _end = _data.find(MemoFile.EOT)
+            if 0 <= _end <= _size:
+                _data = _data[:_end]
+                self.remaining = 0
+            elif len(_data) <= _size:
+                # end of file without the terminator
+                self.remaining = 0
+            else:
+                _data = _data[:_size]
+        buffer[:len(_data)] = _data
+        self.position += len(_data)
+        return len(_data)
+
 class MemoFile(object):
 
     """Memo file object"""
 
-    __slots__ = ("name", "stream", "is_fpt", "blocksize", "tail")
+    __slots__ = (
+        "name", "stream", "is_fpt", "blocksize", "tail", "close_stream",
+        "_mmap", "defer_tail", "_tail_changed", "cache_size", "_cache",
+        "cache_hits", "cache_misses", "buffer_size", "_buffer",
+        "reuse_blocks", "_free", "_free_ends",
+    )
 
     # End Of Text
     EOT = b"\x1A\x1A"
 
+    # approximate size (in bytes) of the data written at once by `write_many`
+    BUFFER_SIZE = 1 << 16
+
     def __init__(self, f, blocksize=512, fpt=True,
-            readOnly=False, new=False,
+            readOnly=False, new=False, mmap=False, defer_tail=False,
+            cache_size=0, buffer_size=0, reuse_blocks=False,
     ):
         """Initialize instance.
 
@@ -62,8 +135,49 @@ class MemoFile(object):
             new:
                 True to create new memo file,
                 False to open existing file.
+            mmap:
+                If True, memory-map the file and slice memo blocks
+                out of the map.  Requires ``readOnly`` mode.
+            defer_tail:
+                If True, the next free block pointer in the file
+                header is updated by `flush` only, not after every
+                `write`.  Use for sequential writers.
+            cache_size:
+                Maximum number of values kept by `read` in the cache
+                of the least recently used blocks.  0 disables the
+                cache.  Counts of the cache hits and misses are kept
+                in `cache_hits` and `cache_misses` attributes.
+            buffer_size:
+                If set, written blocks are kept in memory until
+                there are at least ``buffer_size`` bytes of them
+                (or until `flush`), and the next free block pointer
+                is updated by `flush` only.  Use for bulk loads.
+            reuse_blocks:
+                If True, `rewrite` overwrites values in place and
+                blocks released by `rewrite` and `free` are reused
+                by `write`; see also `rebuild_free_map` and
+                `load_free_map`.  Use only if memo blocks are never
+                shared by several records.  Records written by the
+                table reuse blocks only if they are lazy records (see
+                `record.DbfRecord`) or if they are changed with the
+                `dbf.Dbf` update methods.
         """
+        if mmap and (new or not readOnly):
+            raise ValueError("mmap is supported in read-only mode only")
         self.is_fpt = fpt
+        self.defer_tail = defer_tail
+        self._tail_changed = False
+        self.cache_size = cache_size
+        # block number -> MemoData, least recently used first
+        self._cache = collections.OrderedDict()
+        self.cache_hits = self.cache_misses = 0
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+        self.reuse_blocks = reuse_blocks
+        # free block runs: start -> count and end -> start
+        self._free = {}
+        self._free_ends = {}
+        self.close_stream = isinstance(f, str)
         if isinstance(f, str):
             # a filename
             self.name = f
@@ -86,16 +200,18 @@ class MemoFile(object):
                 self.blocksize = 512 * blocksize
             else:
                 self.blocksize = blocksize
-            self.tail = 512 / self.blocksize
+            # the first block after 512 bytes of the file header
+            self.tail = (512 + self.blocksize - 1) // self.blocksize
             self.stream.write(
                 struct.pack(">LHH", self.tail, 0, self.blocksize)
-                + "\0" * 8 + "\x03" + "\0" * 495)
+                + b"\0" * 8 + b"\x03" + b"\0" * 495)
         else:
             (self.tail, _zero, self.blocksize) = struct.unpack(">LHH",
                 self.stream.read(8))
             if not self.is_fpt:
                 # In DBT files, block size is fixed to 512 bytes
                 self.blocksize = 512
+        self._mmap = utils.map_stream(self.stream) if mmap else None
 
     @staticmethod
     def memo_file_name(name, isFpt=True):
@@ -119,56 +235,344 @@ class MemoFile(object):
         else:
             return name[:-1] + "T"
 
+    def _read(self, position, size):
+        """Return ``size`` bytes of the file starting at ``position``."""
+        if self._buffer:
+            self._flush_buffer()
+        if self._mmap is not None:
+            return self._mmap[position:position + size]
+        self.stream.seek(position)
+        return self.stream.read(size)
+
     def read(self, blocknum):
         """Read the block addressed by blocknum
 
         Return a MemoData object.
         """
-        self.stream.seek(self.blocksize * blocknum)
+        if self.cache_size:
+            _value = self._cache.get(blocknum)
+            if _value is not None:
+                self._cache.move_to_end(blocknum)
+                self.cache_hits += 1
+                return _value
+            self.cache_misses += 1
+            _value = self._read_block(blocknum)
+            self._cache[blocknum] = _value
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return _value
+        return self._read_block(blocknum)
+
+    def _read_block(self, blocknum):
+        """Read the block addressed by blocknum bypassing the cache."""
+        _pos = self.blocksize * blocknum
         if self.is_fpt:
-            _type, _len = struct.unpack(">LL", self.stream.read(8))
+            _type, _len = struct.unpack(">LL", self._read(_pos, 8))
             if _type == MemoData.TYPE_NULL:
                 _value = b''
             else:
-                _value = self.stream.read(_len)
+                _value = self._read(_pos + 8, _len)
         else:
             # DBT
             _type = MemoData.TYPE_MEMO
-            self.stream.seek(self.blocksize * blocknum)
-            _value = b''
-            while self.EOT not in _value:
-                _value += self.stream.read(self.blocksize)
-            _value = _value[:_value.find(self.EOT)]
+            _value = bytearray()
+            while True:
+                _data = self._read(_pos + len(_value), self.blocksize)
+                # terminator may start at the last byte of previous data
+                _end = max(len(_value) - 1, 0)
+                _value += _data
+                _end = _value.find(self.EOT, _end)
+                if _end >= 0:
+                    del _value[_end:]
+                    break
+                if len(_data) < self.blocksize:
+                    # end of file without the terminator
+                    break
 
         return MemoData(_value, _type)
 
+    def open_blob(self, blocknum):
+        """Return `MemoBlob` reading the block addressed by blocknum.
+
+        The value is read chunk by chunk, as the blob is read,
+        so it is never kept in memory as a whole.
+        """
+        _pos = self.blocksize * blocknum
+        if self.is_fpt:
+            _type, _len = struct.unpack(">LL", self._read(_pos, 8))
+            if _type == MemoData.TYPE_NULL:
+                _len = 0
+            return MemoBlob(self, _pos + 8, _len, _type)
+        else:
+            return MemoBlob(self, _pos, None, MemoData.TYPE_MEMO)
+
     def write(self, value):
         """Write a value to FPT file, return starting block number
 
         The value argument may be simple string or a MemoData object.
         In the former case value type is assumed to be TYPE_MEMO.
         """
-        _rv = self.tail
+        return self.write_many([value])[0]
+
+    def write_many(self, values):
+        """Write all ``values``, return list of their block numbers.
+
+        Values are appended to consecutive blocks, or written to free
+        block runs if `reuse_blocks` is set; see `write`. Unless the
+        file has a write buffer (``buffer_size``), appended values are
+        written about `BUFFER_SIZE` bytes at once.
+        """
+        _blocks = []
+        _size = self.buffer_size or self.BUFFER_SIZE
+        for value in values:
+            _data = self._encode(value)
+            _cnt = len(_data) // self.blocksize
+            _block = self._allocate(_cnt) if self.reuse_blocks else None
+            if _block is None:
+                _block = self.tail
+                self.tail += _cnt
+                self._buffer += _data
+                if len(self._buffer) >= _size:
+                    self._flush_buffer()
+            else:
+                self._write_blocks(_block, _data)
+            self._cache.pop(_block, None)
+            _blocks.append(_block)
+        if not self.buffer_size:
+            self._flush_buffer()
+        if _blocks:
+            if self.defer_tail or self.buffer_size:
+                self._tail_changed = True
+            else:
+                self._write_tail()
+        return _blocks
+
+    def _encode(self, value):
+        """Return data of the ``value`` padded to the block boundary."""
         if not isinstance(value, bytes):
             raise ValueError('value must be bytes')
-        self.stream.seek(self.blocksize * _rv)
         if self.is_fpt:
             _length = len(value) + 8
             _type = getattr(value, "type", MemoData.TYPE_MEMO)
-            self.stream.write(struct.pack(">LL", _type, len(value)) + value)
+            _data = struct.pack(">LL", _type, len(value)) + value
         else:
             _length = len(value) + 2
-            self.stream.write(value + self.EOT)
+            _data = value + self.EOT
         #_cnt = int(math.ceil(float(_length) / self.blocksize))
         _cnt = (_length + self.blocksize - 1) // self.blocksize
-        self.stream.write(b"\x00" * (_cnt * self.blocksize - _length))
-        self.tail += _cnt
+        return _data + b"\x00" * (_cnt * self.blocksize - _length)
+
+    def _write_blocks(self, blocknum, data):
+        """Write ``data`` to the blocks before the tail."""
+        # buffered blocks may overlap
+        self._flush_buffer()
+        self.stream.seek(self.blocksize * blocknum)
+        self.stream.write(data)
+
+    def block_count(self, blocknum):
+        """Return number of blocks used by the value at blocknum."""
+        if self.is_fpt:
+            _len = struct.unpack(">L", self._read(
+                self.blocksize * blocknum + 4, 4
+            ))[0]
+            _len += 8
+        else:
+            _blob = self.open_blob(blocknum)
+            _len = 2
+            for _data in iter(lambda: _blob.read(self.BUFFER_SIZE), b""):
+                _len += len(_data)
+        return (_len + self.blocksize - 1) // self.blocksize
+
+    def copy_from(self, memo, blocknum):
+        """Append value at blocknum of another memo file, return its block.
+
+        Blocks of the value are copied as they are, chunk by chunk.
+        Both files must have the same format and block size.
+        """
+        if memo.blocksize != self.blocksize or memo.is_fpt != self.is_fpt:
+            raise ValueError("memo files have different format")
+        _rv = self.tail
+        _pos = self.blocksize * blocknum
+        _end = _pos + self.blocksize * memo.block_count(blocknum)
+        _size = self.buffer_size or self.BUFFER_SIZE
+        _size = max(1, _size // self.blocksize) * self.blocksize
+        while _pos < _end:
+            _cnt = min(_size, _end - _pos)
+            # pad the value truncated by the end of file
+            _data = memo._read(_pos, _cnt).ljust(_cnt, b"\x00")
+            self._cache.pop(self.tail, None)
+            self.tail += _cnt // self.blocksize
+            self._buffer += _data
+            if len(self._buffer) >= _size:
+                self._flush_buffer()
+            _pos += _cnt
+        if not self.buffer_size:
+            self._flush_buffer()
+        if self.defer_tail or self.buffer_size:
+            self._tail_changed = True
+        else:
+            self._write_tail()
+        return _rv
+
+    def rewrite(self, blocknum, value):
+        """Replace the value at blocknum, return new block number.
+
+        If `reuse_blocks` is set and the ``value`` fits into the blocks
+        of the old value, it is written in place (remaining blocks are
+        freed); otherwise the old blocks are freed and the ``value``
+        is written as by `write`.  Without `reuse_blocks` this is
+        the same as `write`.
+        """
+        if not (self.reuse_blocks and blocknum):
+            return self.write(value)
+        _data = self._encode(value)
+        _cnt = len(_data) // self.blocksize
+        _old = self.block_count(blocknum)
+        if _cnt > _old:
+            self._add_free(blocknum, _old)
+            return self.write(value)
+        self._write_blocks(blocknum, _data)
+        self._cache.pop(blocknum, None)
+        if _cnt < _old:
+            self._add_free(blocknum + _cnt, _old - _cnt)
+        return blocknum
+
+    def free(self, blocknum):
+        """Mark blocks of the value at blocknum free for reuse.
+
+        Ignored unless `reuse_blocks` is set.
+        """
+        if self.reuse_blocks and blocknum:
+            self._cache.pop(blocknum, None)
+            self._add_free(blocknum, self.block_count(blocknum))
+
+    def _add_free(self, start, count):
+        """Add run of ``count`` blocks at ``start`` to the free map."""
+        _end = start + count
+        if _end in self._free:
+            # join the following run
+            _next = self._free.pop(_end)
+            del self._free_ends[_end + _next]
+            count += _next
+        if start in self._free_ends:
+            # join the preceding run
+            _prev = self._free_ends.pop(start)
+            count += self._free.pop(_prev)
+            start = _prev
+        self._free[start] = count
+        self._free_ends[start + count] = start
+
+    def _allocate(self, count):
+        """Take ``count`` blocks from the free map, return the first one.
+
+        Return None if there is no free run that large.
+        """
+        for (_start, _cnt) in self._free.items():
+            if _cnt >= count:
+                break
+        else:
+            return None
+        del self._free[_start]
+        del self._free_ends[_start + _cnt]
+        if _cnt > count:
+            self._free[_start + count] = _cnt - count
+            self._free_ends[_start + _cnt] = _start + count
+        return _start
+
+    @property
+    def free_blocks(self):
+        """Sorted list of ``(start, count)`` runs of free blocks."""
+        return sorted(self._free.items())
+
+    def rebuild_free_map(self, blocks):
+        """Build the free map from the block numbers of all live values.
+
+        ``blocks`` is an iterable of all block numbers referenced by
+        the table (zeros are ignored); blocks not used by these values
+        are free.
+        """
+        self._free = {}
+        self._free_ends = {}
+        # the first block after 512 bytes of the file header
+        _pos = (512 + self.blocksize - 1) // self.blocksize
+        for _block in sorted(set(blocks)):
+            if not _block:
+                continue
+            if _block > _pos:
+                self._add_free(_pos, _block - _pos)
+            _pos = max(_pos, _block + self.block_count(_block))
+        if self.tail > _pos:
+            self._add_free(_pos, self.tail - _pos)
+
+    def free_map_name(self):
+        """Return name of the free map sidecar file."""
+        return self.name + ".free"
+
+    def save_free_map(self, name=None):
+        """Store the free map to the sidecar file.
+
+        The file is valid while the tail of the memo file
+        is not changed by other programs.
+        """
+        self.flush()
+        _runs = self.free_blocks
+        with open(name or self.free_map_name(), "wb") as _stream:
+            _stream.write(struct.pack(">LL", self.tail, len(_runs)))
+            _stream.write(b"".join([
+                struct.pack(">LL", _start, _cnt) for (_start, _cnt) in _runs
+            ]))
+
+    def load_free_map(self, name=None):
+        """Load the free map from the sidecar file.
+
+        Return True on success, False if the file doesn't exist
+        or doesn't match the memo file.
+        """
+        try:
+            with open(name or self.free_map_name(), "rb") as _stream:
+                _data = _stream.read()
+        except FileNotFoundError:
+            return False
+        (_tail, _count) = struct.unpack_from(">LL", _data)
+        if _tail != self.tail or len(_data) != 8 + 8 * _count:
+            return False
+        self._free = {}
+        self._free_ends = {}
+        for (_start, _cnt) in struct.iter_unpack(">LL", _data[8:]):
+            self._add_free(_start, _cnt)
+        return True
+
+    def _flush_buffer(self):
+        """Write buffered blocks preceding the tail."""
+        if self._buffer:
+            self.stream.seek(
+                self.blocksize * self.tail - len(self._buffer)
+            )
+            self.stream.write(self._buffer)
+            self._buffer = bytearray()
+
+    def _write_tail(self):
+        """Store next free block number in the file header."""
         self.stream.seek(0)
         self.stream.write(struct.pack(">L", self.tail))
-        return _rv
+        self._tail_changed = False
 
     def flush(self):
         """Flush data to the associated stream."""
+        self._flush_buffer()
+        if self._tail_changed:
+            self._write_tail()
         self.stream.flush()
 
+    def close(self):
+        """Release the memory map; close the stream opened by name."""
+        self._flush_buffer()
+        if self._tail_changed:
+            self._write_tail()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self.close_stream:
+            self.stream.close()
+
 # vim: et sts=4 sw=4 :
@@ -0,0 +1,126 @@
+"""Parallel table scans in worker processes.
+
+Record positions are pure arithmetic, so the table is split into
+contiguous record ranges and every worker process opens the file
+read-only, parses the header and decodes its own range.
+
+Functions passed to the workers must be picklable (e.g. module-level
+functions), see `concurrent.futures.ProcessPoolExecutor`.
+
+"""
+
+__all__ = ["split_range", "parallel_map", "parallel_scan"]
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def split_range(count, parts):
+    """Return list of ``(start, stop)`` covering ``range(count)``.
+
+    ``count`` records are split into at most ``parts``
+    contiguous ranges of about equal size.
+    """
+    parts = max(1, min(parts, count))
+    size, rest = divmod(count, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        stop = start + size + (part < rest)
+        if stop > start:
+            ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _open(name, memo_file, ignore_errors, lazy):
+    # imported here: dbf module imports this one
+    from .dbf import Dbf
+    return Dbf(name, read_only=True, memo_file=memo_file,
+               ignore_errors=ignore_errors, lazy=lazy)
+
+
+def _map_range(name, memo_file, ignore_errors, lazy, start, stop, func):
+    """Worker: return list of ``func(record)`` for the record range."""
+    table = _open(name, memo_file, ignore_errors, lazy)
+    try:
+        return [func(record) for record in table.scan(start, stop)]
+    finally:
+        table.close()
+
+
+def _scan_range(name, memo_file, ignore_errors, lazy, start, stop, func):
+    """Worker: return ``func(records)`` for the record range."""
+    table = _open(name, memo_file, ignore_errors, lazy)
+    try:
+        return func(table.scan(start, stop))
+    finally:
+        table.close()
+
+
+def parallel_map(name, record_count, func, workers=None, chunk_records=None,
+                 memo_file=None, ignore_errors=False, lazy=False):
+    """Yield ``func(record)`` for every record of the table in file order.
+
+    Arguments:
+        name:
+            name of the DBF file.
+        record_count:
+            number of records to process.
+        func:
+            picklable function called with every `DbfRecord`.
+        workers:
+            number of worker processes; default is the CPU count.
+        chunk_records:
+            number of records processed by a worker at once; results
+            are streamed back chunk by chunk. Default splits the table
+            into four chunks per worker.
+        memo_file:
+            name of the memo file if it isn't the default one.
+        ignore_errors, lazy:
+            passed to `dbf.Dbf` opened by the workers.
+
+    """
+    workers = workers or os.cpu_count() or 1
+    if chunk_records:
+        parts = (record_count + chunk_records - 1) // chunk_records
+    else:
+        parts = workers * 4
+    ranges = split_range(record_count, parts)
+    with ProcessPoolExecutor(workers) as executor:
+        results = executor.map(
+            _map_range,
+            itertools.repeat(name), itertools.repeat(memo_file),
+            itertools.repeat(ignore_errors), itertools.repeat(lazy),
+            [start for (start, stop) in ranges],
+            [stop for (start, stop) in ranges],
+            itertools.repeat(func),
+        )
+        for chunk in results:
+            yield from chunk
+
+
+def parallel_scan(name, record_count, func, workers=None, memo_file=None,
+                  ignore_errors=False, lazy=False):
+    """Return list of ``func(records)`` results, one per worker range.
+
+    ``func`` is called in a worker process with an iterator over
+    `DbfRecord` instances of one contiguous record range, so it can
+    reduce the range locally (e.g. ``sum`` or count values). Results
+    are returned in the order of the ranges. Other arguments are
+    the same as for `parallel_map`.
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = split_range(record_count, workers)
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(
+            _scan_range,
+            itertools.repeat(name), itertools.repeat(memo_file),
+            itertools.repeat(ignore_errors), itertools.repeat(lazy),
+            [start for (start, stop) in ranges],
+            [stop for (start, stop) in ranges],
+            itertools.repeat(func),
+        ))
+
+# vim: et sts=4 sw=4 :
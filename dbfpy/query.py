@@ -0,0 +1,211 @@
+"""Record predicates checked on raw record data.
+
+A condition (``where``) is a mapping of field names to predicates;
+plain values mean equality. Predicates are compiled against the field
+definition so that most of them compare raw field bytes without
+decoding the record:
+
+    ====  ======================  ==============================
+    Type  Raw comparison          Otherwise
+    ====  ======================  ==============================
+    C     `Equal`, `Prefix`       `Range` decodes the field only
+    D     `Equal`, `Range`        non "yyyymmdd" values decoded
+    I     `Equal`                 `Range` unpacks the field only
+    L     `Equal`
+    N, F                          the field is decoded only
+    ====  ======================  ==============================
+
+Examples:
+
+    table.select(where={
+        "NAME": Prefix("Jo"),
+        "BIRTHDATE": Range(datetime.date(1980, 1, 1), None),
+        "MEMBER": True,
+    })
+
+"""
+
+__all__ = ["Predicate", "Equal", "Prefix", "Range", "compile_where"]
+
+import struct
+
+from .codec import DbfRecordDecoder
+from .utils import get_date, INVALID_VALUE
+
+
+def _never(buffer, offset):
+    return False
+
+
+class Predicate(object):
+    """Abstract condition on a field value.
+
+    Child classes must override `test`, the condition on the decoded
+    field value. They may override `compile` to check raw field data.
+
+    """
+
+    def test(self, value):
+        """True if decoded field ``value`` satisfies the predicate."""
+        raise NotImplementedError
+
+    def compile(self, field, encoding):
+        """Return function checking the record data.
+
+        The function is called with the buffer holding the record
+        and the offset of the record in the buffer.
+
+        Default implementation decodes the ``field`` only and
+        passes the value to `test`.
+        """
+        decode = DbfRecordDecoder([field], encoding).decode_field
+        test = self.test
+        return lambda buffer, offset: test(decode(buffer, 0, offset))
+
+
+class Equal(Predicate):
+    """Field value equals to the ``value``."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def test(self, value):
+        return value == self.value
+
+    def compile(self, field, encoding):
+        start = field.start
+        end = field.start + field.length
+        value = self.value
+        fallback = super().compile(field, encoding)
+
+        if field.type_code == b"C" and isinstance(value, str):
+            # decoded values never have trailing spaces
+            raw = value.encode(encoding)
+            if value != value.rstrip(" ") or len(raw) > field.length:
+                return _never
+            raw = raw.ljust(field.length)
+            return lambda buffer, offset: buffer.startswith(raw, offset + start)
+
+        if field.type_code == b"D":
+            raw = field.encode(value and get_date(value), encoding)
+
+            def check(buffer, offset):
+                if buffer.startswith(raw, offset + start):
+                    return True
+                value = buffer[offset + start:offset + end]
+                if value.isdigit() or not value.strip():
+                    return False
+                # non canonical value (e.g. leading spaces)
+                return fallback(buffer, offset)
+            return check
+
+        if field.type_code == b"L":
+            codes = frozenset([
+                code for code in b"?NnFfYyTt "
+                if field.decode(bytes([code])) == value
+            ])
+            return lambda buffer, offset: buffer[offset + start] in codes
+
+        if field.type_code == b"I" and field.length == 4:
+            try:
+                if int(value) != value:
+                    return _never
+                raw = struct.pack("<i", int(value))
+            except (TypeError, ValueError, OverflowError, struct.error):
+                return _never
+            return lambda buffer, offset: buffer.startswith(raw, offset + start)
+
+        return fallback
+
+
+class Prefix(Predicate):
+    """Character field value starts with the ``value``."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def test(self, value):
+        return isinstance(value, str) and value.startswith(self.value)
+
+    def compile(self, field, encoding):
+        if field.type_code != b"C":
+            raise TypeError(
+                "[%s] prefix is supported for character fields only" %
+                field.name
+            )
+        if self.value.endswith(" "):
+            # stored values are padded with spaces
+            return super().compile(field, encoding)
+
+        start = field.start
+        raw = self.value.encode(encoding)
+        if len(raw) > field.length:
+            return _never
+        return lambda buffer, offset: buffer.startswith(raw, offset + start)
+
+
+class Range(Predicate):
+    """Field value is between ``low`` and ``high`` (both inclusive).
+
+    None bound means the range is open from that side. Empty
+    field values (None) never match.
+    """
+
+    def __init__(self, low=None, high=None):
+        self.low = low
+        self.high = high
+
+    def test(self, value):
+        if value is None or value is INVALID_VALUE:
+            return False
+        if self.low is not None and value < self.low:
+            return False
+        if self.high is not None and value > self.high:
+            return False
+        return True
+
+    def compile(self, field, encoding):
+        fallback = super().compile(field, encoding)
+        if field.type_code != b"D":
+            return fallback
+
+        start = field.start
+        end = field.start + field.length
+        # "yyyymmdd" values are ordered as dates
+        low = b"0" * 8 if self.low is None else \
+            field.encode(get_date(self.low), encoding)
+        high = b"9" * 8 if self.high is None else \
+            field.encode(get_date(self.high), encoding)
+
+        def check(buffer, offset):
+            value = buffer[offset + start:offset + end]
+            if value.isdigit():
+                return low <= value <= high
+            if not value.strip():
+                return False
+            # non canonical value (e.g. leading spaces)
+            return fallback(buffer, offset)
+        return check
+
+
+def compile_where(header, where):
+    """Return function checking record data against ``where``.
+
+    ``where`` is a mapping of field names to `Predicate` instances
+    or plain values (tested for equality). The returned function
+    is called with a buffer and the offset of the record in it.
+    """
+    encoding = header.code_page.encoding
+    checks = []
+    for (name, predicate) in where.items():
+        if not isinstance(predicate, Predicate):
+            predicate = Equal(predicate)
+        checks.append(predicate.compile(header[name], encoding))
+
+    if len(checks) == 1:
+        return checks[0]
+    return lambda buffer, offset: all(
+        check(buffer, offset) for check in checks
+    )
+
+# vim: et sts=4 sw=4 :
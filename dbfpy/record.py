@@ -12,6 +12,9 @@ from .header import DbfHeader
 from . import utils
 import locale
 
+# placeholder for the field values not decoded yet by lazy records
+_NOT_DECODED = object()
+
 
 class DbfRecord(object):
     """DBF record.
@@ -22,13 +25,21 @@ class DbfRecord(object):
     Class implements mapping/sequence interface, so
     fields could be accessed via their names or indexes
     (names is a preferred way to access fields).
+
+    Lazy records keep the raw record data and decode a field on
+    first access only. Fields which were not assigned are written
+    back byte-for-byte by `to_bytes`.
     """
 
-    __slots__ = "dbf", "header", "_index", "deleted", "fields"
+    __slots__ = (
+        "dbf", "header", "_index", "deleted", "_fields", "lazy", "_raw",
+        "_changed", "_decoded",
+    )
 
     ## creation and initialization
 
-    def __init__(self, header, index=None, deleted=False, data=None):
+    def __init__(self, header, index=None, deleted=False, data=None,
+                 lazy=False):
         """Instance initialization.
 
         Arguments:
@@ -44,6 +55,9 @@ class DbfRecord(object):
                 Can be None, sequence, IOBase stream or bytes,
                 This is a data of the fields.
                 If this argument is None, default values will be used.
+            lazy:
+                if set, record data read by `read` is decoded
+                field by field on first access.
 
         """
         if not isinstance(header, DbfHeader):
@@ -52,14 +66,18 @@ class DbfRecord(object):
         self.header = header
         # for IDE inspection
         self._index = None
+        self._raw = None
+        self._changed = None
+        self._decoded = None
+        self.lazy = lazy
         self.index = index
         self.deleted = deleted
         if data is None:
             self.fields = [field.default_value for field in header.fields]
-        elif hasattr(data, '__iter__'):
-            self.fields = list(data)
         elif isinstance(data, (io.IOBase, bytes)):
             self.read(data)
+        elif hasattr(data, '__iter__'):
+            self.fields = list(data)
         else:
             raise TypeError("doesn't support this field data (%s)" % type(data))
 
@@ -76,6 +94,28 @@ class DbfRecord(object):
     def index(self):
         return self._index
 
+    @property
+    def fields(self):
+        """List of field values.
+
+        Accessing the list decodes all fields of the lazy record.
+        The raw data is kept: values assigned through the list are
+        detected by `to_bytes`, other fields are still written back
+        byte-for-byte.
+        """
+        if self._raw is not None and self._decoded is None:
+            for (index, value) in enumerate(self._fields):
+                if value is _NOT_DECODED:
+                    self._decode_field(index)
+            # decoded values to compare the list items with
+            self._decoded = list(self._fields)
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields):
+        self._fields = fields
+        self._raw = self._changed = self._decoded = None
+
     @index.setter
     def index(self, index):
         if index is None:
@@ -98,15 +138,26 @@ class DbfRecord(object):
     def decode(self, string):
         """Return record read from the string."""
         try:
-            return [field.decode(
-                string[field.start:field.start + field.length],
-                encoding=self.header.code_page.encoding
-            ) for field in self.header.fields]
+            return self.header.decoder.decode(string)
+        except Exception:
+            if not self.header.ignore_errors:
+                raise
+            # fields failing to decode get INVALID_VALUE
+            return self.header.decoder.decode_fields(
+                string, 0, utils.INVALID_VALUE
+            )
+
+    def _decode_field(self, index):
+        """Decode, cache and return value of the lazy record field."""
+        try:
+            value = self.header.decoder.decode_field(self._raw, index)
         except:
             if self.header.ignore_errors:
-                return utils.INVALID_VALUE
+                value = utils.INVALID_VALUE
             else:
                 raise
+        self._fields[index] = value
+        return value
 
     def read(self, string):
         """Read record from string or stream."""
@@ -120,7 +171,13 @@ class DbfRecord(object):
         if string[0:1] not in b' *':
             raise ValueError('Record deleted flag error ({})', string[0])
         self.deleted = (string[0:1] == b'*')
-        self.fields = self.decode(string)
+        if self.lazy:
+            self._fields = [_NOT_DECODED] * len(self.header.fields)
+            self._raw = bytes(string)
+            self._changed = set()
+            self._decoded = None
+        else:
+            self.fields = self.decode(string)
         return self
 
     def __str__(self):
@@ -144,13 +201,44 @@ class DbfRecord(object):
 
     def to_bytes(self):
         """Return string packed record values."""
-        return b''.join(
-            [(b' ', b'*')[self.deleted]] +
-            [
-                _def.encode(_dat, encoding=self.header.code_page.encoding)
-                for (_def, _dat) in zip(self.header.fields, self.fields)
-            ]
-        )
+        if self._raw is None:
+            return self.header.encoder.encode(self.fields, self.deleted)
+
+        # lazy record: re-encode assigned fields only
+        changed = set(self._changed)
+        if self._decoded is not None:
+            changed.update(
+                index for (index, value) in enumerate(self._fields)
+                if value is not self._decoded[index]
+            )
+        data = bytearray(self._raw)
+        data[0:1] = (b' ', b'*')[self.deleted]
+        encoding = self.header.code_page.encoding
+        memo_fields = []
+        for index in changed:
+            field = self.header.fields[index]
+            start = field.start
+            end = start + field.length
+            if field.is_memo:
+                # old memo blocks may be reused, see `MemoFile.rewrite`
+                data[start:end] = field.encode_update(
+                    self._raw[start:end], self._fields[index], encoding
+                )[0]
+                memo_fields.append(field)
+            else:
+                data[start:end] = field.encode(self._fields[index], encoding)
+        if memo_fields:
+            # memo values are written; keep the new pointers
+            raw = bytearray(self._raw)
+            for field in memo_fields:
+                end = field.start + field.length
+                raw[field.start:end] = data[field.start:end]
+                index = self.header.fields.index(field)
+                self._changed.discard(index)
+                if self._decoded is not None:
+                    self._decoded[index] = self._fields[index]
+            self._raw = bytes(raw)
+        return bytes(data)
 
     def as_dict(self):
         """Return a dictionary of fields.
@@ -164,18 +252,21 @@ class DbfRecord(object):
 
     def __getitem__(self, key):
         """Return value by field name or field index."""
-        if isinstance(key, int):
-            # integer index of the field
-            return self.fields[key]
-        # assuming string field name
-        return self.fields[self.header.index_of_field_name(key)]
+        if not isinstance(key, int):
+            # assuming string field name
+            key = self.header.index_of_field_name(key)
+        value = self._fields[key]
+        if value is _NOT_DECODED:
+            value = self._decode_field(key)
+        return value
 
     def __setitem__(self, key, value):
         """Set field value by integer index of the field or string name."""
-        if isinstance(key, int):
-            # integer index of the field
-            return self.fields[key]
-        # assuming string field name
-        self.fields[self.header.index_of_field_name(key)] = value
+        if not isinstance(key, int):
+            # assuming string field name
+            key = self.header.index_of_field_name(key)
+        self._fields[key] = value
+        if self._raw is not None:
+            self._changed.add(key)
 
 # vim: et sts=4 sw=4 :
@@ -8,6 +8,7 @@ __version__ = "$Revision: 1.4 $"[11:-2]
 __date__ = "$Date: 2007/02/11 08:57:17 $"[7:-2]
 
 import datetime
+import mmap
 import time
 
 
@@ -114,6 +115,15 @@ def get_date_time(value=None):
     return datetime.datetime.fromtimestamp(value.ticks())
 
 
+def map_stream(stream):
+    """Return read-only memory map of the file opened as ``stream``.
+
+    ``stream`` must be a real file object (have a working ``fileno``).
+
+    """
+    return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+
 class classproperty(property):
     """Works in the same way as a ``property``, but for the classes."""
 
@@ -0,0 +1,266 @@
+"""Memo file compaction.
+
+`vacuum_memo` copies memo values referenced by the table records into
+a new memo file, rewrites the block pointers of the records and
+replaces the memo file. Memory usage doesn't depend on the number of
+references: block numbers are sorted in runs stored in temporary files
+which are merged, and the map of old to new block numbers is kept in
+memory-mapped temporary files searched with binary search.
+
+"""
+
+__all__ = ["sorted_blocks", "BlockMap", "vacuum_memo"]
+
+import array
+import bisect
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from . import memo
+
+# number of block numbers sorted in memory at once
+RUN_SIZE = 1 << 20
+
+# number of block numbers read or written at once
+CHUNK_SIZE = 1 << 14
+
+
+def _write_run(blocks, directory):
+    """Store sorted unique ``blocks`` to a new file, return its name."""
+    (handle, name) = tempfile.mkstemp(dir=directory)
+    with os.fdopen(handle, "wb") as stream:
+        array.array("I", sorted(set(blocks))).tofile(stream)
+    return name
+
+
+def _read_run(name):
+    """Yield block numbers stored by `_write_run`."""
+    with open(name, "rb") as stream:
+        while True:
+            chunk = array.array("I")
+            try:
+                chunk.fromfile(stream, CHUNK_SIZE)
+            except EOFError:
+                # items available before the end are read
+                yield from chunk
+                return
+            yield from chunk
+
+
+def sorted_blocks(blocks, directory, run_size=RUN_SIZE):
+    """Yield sorted unique non-zero block numbers of ``blocks``.
+
+    Up to ``run_size`` numbers are sorted in memory; larger
+    inputs are sorted in runs stored to temporary files in
+    ``directory`` and merged.
+    """
+    runs = []
+    run = []
+    for block in blocks:
+        if block:
+            run.append(block)
+            if len(run) >= run_size:
+                runs.append(_write_run(run, directory))
+                run = []
+    if not runs:
+        yield from sorted(set(run))
+        return
+    if run:
+        runs.append(_write_run(run, directory))
+
+    last = None
+    for block in heapq.merge(*[_read_run(name) for name in runs]):
+        if block != last:
+            yield block
+            last = block
+
+
+class BlockMap(object):
+    """Map of old to new block numbers kept in temporary files.
+
+    Pairs must be added with `add` in ascending order of both the old
+    and the new block numbers; `finish` makes the map ready for `get`
+    and `get_old`.
+
+    """
+
+    __slots__ = ("files", "chunks", "count", "_maps", "_views")
+
+    def __init__(self, directory):
+        self.files = [
+            tempfile.TemporaryFile(dir=directory) for i in range(2)
+        ]
+        # buffered old and new block numbers
+        self.chunks = (array.array("I"), array.array("I"))
+        self.count = 0
+        self._maps = []
+        self._views = None
+
+    def add(self, old, new):
+        """Add pair of the ``old`` and ``new`` block numbers."""
+        self.chunks[0].append(old)
+        self.chunks[1].append(new)
+        self.count += 1
+        if len(self.chunks[0]) >= CHUNK_SIZE:
+            self._write_chunks()
+
+    def _write_chunks(self):
+        for (stream, chunk) in zip(self.files, self.chunks):
+            chunk.tofile(stream)
+            del chunk[:]
+
+    def finish(self):
+        """Write buffered pairs, map the files for `get`."""
+        self._write_chunks()
+        if not self.count:
+            # empty files can't be mapped
+            return
+        views = []
+        for stream in self.files:
+            stream.flush()
+            self._maps.append(
+                mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+            views.append(memoryview(self._maps[-1]).cast("I"))
+        self._views = tuple(views)
+
+    def get(self, old):
+        """Return new block number of the ``old`` one."""
+        return self._find(old, 0)
+
+    def get_old(self, new):
+        """Return old block number of the ``new`` one."""
+        return self._find(new, 1)
+
+    def _find(self, block, column):
+        if self._views is None:
+            raise KeyError(block)
+        keys = self._views[column]
+        index = bisect.bisect_left(keys, block)
+        if index == len(keys) or keys[index] != block:
+            raise KeyError(block)
+        return self._views[1 - column][index]
+
+    def close(self):
+        """Release the maps, remove the files."""
+        if self._views is not None:
+            for view in self._views:
+                view.release()
+        self._views = None
+        for _map in self._maps:
+            _map.close()
+        self._maps = []
+        for stream in self.files:
+            stream.close()
+
+
+def _rewrite_pointers(table, starts, lookup, stop, buffer_records):
+    """Replace non-zero memo pointers with their ``lookup`` results.
+
+    Pointers at the ``starts`` offsets of the records before ``stop``
+    are rewritten in place, one span per chunk. Yield index of the
+    first record not rewritten yet after every chunk.
+    """
+    record_length = table.header.record_length
+    for (index, data) in table._iter_chunks(0, stop, buffer_records):
+        data = bytearray(data)
+        first = last = None
+        for offset in range(0, len(data), record_length):
+            for start in starts:
+                position = offset + start
+                (block,) = struct.unpack_from("<L", data, position)
+                if not block:
+                    continue
+                new_block = lookup(block)
+                if new_block != block:
+                    struct.pack_into("<L", data, position, new_block)
+                    if first is None:
+                        first = position
+                    last = position + 4
+        if first is not None:
+            table._write_span(index, data, first, last)
+        yield index + len(data) // record_length
+
+
+def vacuum_memo(table, buffer_records=None, run_size=RUN_SIZE):
+    """Drop memo values not referenced by the ``table`` records.
+
+    Values referenced by any record (deleted ones too) are copied in
+    the order of the old block numbers to a new memo file next to the
+    old one, record pointers are rewritten in place and the old memo
+    file is replaced with the new one. If anything fails before the
+    replacement the old pointers are restored and the new memo file
+    is removed. Return number of the copied values. See
+    `dbf.Dbf.vacuum_memo`.
+    """
+    old = table.memo
+    if not old.close_stream:
+        raise ValueError("memo file must be opened by name")
+    if not table.stream.writable():
+        raise OSError('Stream is not writable')
+    table.flush()
+    header = table.header
+    starts = [field.start for field in header.fields if field.is_memo]
+
+    (handle, name) = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(old.name))
+    )
+    os.close(handle)
+    # index of the first record with the old pointers
+    rewritten = 0
+    replaced = False
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            new = memo.MemoFile(
+                name, blocksize=old.blocksize, fpt=old.is_fpt, new=True,
+                buffer_size=memo.MemoFile.BUFFER_SIZE,
+            )
+            blocks = BlockMap(directory)
+            try:
+                for block in sorted_blocks(
+                    table.memo_blocks(buffer_records), directory, run_size
+                ):
+                    blocks.add(block, new.copy_from(old, block))
+                new.close()
+                blocks.finish()
+                for rewritten in _rewrite_pointers(
+                    table, starts, blocks.get, None, buffer_records
+                ):
+                    pass
+                table.flush()
+                # mkstemp creates files readable by the owner only
+                shutil.copymode(old.name, name)
+                old.close()
+                try:
+                    os.replace(name, old.name)
+                    replaced = True
+                finally:
+                    table.memo = memo.MemoFile(
+                        old.name, fpt=old.is_fpt, cache_size=old.cache_size,
+                        reuse_blocks=old.reuse_blocks,
+                    )
+                    header.set_memo_file(table.memo)
+            except Exception:
+                if rewritten and not replaced:
+                    # pointers must match the old memo file again
+                    for _ in _rewrite_pointers(
+                        table, starts, blocks.get_old, rewritten,
+                        buffer_records
+                    ):
+                        pass
+                    table.flush()
+                raise
+            finally:
+                new.close()
+                blocks.close()
+    except Exception:
+        if not replaced and os.path.exists(name):
+            os.remove(name)
+        raise
+    return blocks.count
+
+# vim: et sts=4 sw=4 :
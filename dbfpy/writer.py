@@ -0,0 +1,167 @@
+"""Streaming DBF writer.
+
+Examples:
+
+    Write records from a database cursor:
+
+        with DbfWriter("extract.dbf", [
+            ("C", "NAME", 15),
+            ("N", "AMOUNT", 10, 2),
+            ("D", "DATE"),
+            ("M", "NOTE"),
+        ], code_page="cp1252") as writer:
+            writer.write_many(cursor)
+
+"""
+
+__all__ = ["DbfWriter"]
+
+import datetime
+from io import IOBase
+
+from .header import DbfHeader
+from .record import DbfRecord
+from . import memo
+
+
+class DbfWriter(object):
+    """Append-only sequential DBF writer.
+
+    Records are encoded into a buffer which is written to the stream
+    when it is full; the stream is never rewound until `close`, which
+    writes the final header and the end of file marker. Memo data is
+    written sequentially through a buffer, with the memo file header
+    updated on `close`. Memory usage doesn't depend on the number
+    of records.
+
+    """
+
+    __slots__ = (
+        "name", "header", "stream", "memo", "close_stream",
+        "_buffer", "_offset",
+    )
+
+    # approximate size (in bytes) of the write buffer
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, file, fields, code_page=None, memo_file=None,
+                 fpt=True, buffer_records=None):
+        """Initialize instance.
+
+        Arguments:
+            file:
+                Filename or file-like object; existing file is truncated.
+            fields:
+                list of field definitions, see `DbfHeader.add_field`.
+            code_page:
+                code page (int), encoding name or `CodePage` instance;
+                default is the system encoding.
+            memo_file:
+                optional name of the memo file; default is generated
+                from the DBF file name. Used if there are memo fields.
+            fpt:
+                True to write FoxPro memo file (FPT), False for DBT.
+            buffer_records:
+                number of records written at once; default
+                is about `BUFFER_SIZE` bytes.
+
+        """
+        if isinstance(file, str):
+            self.name = file
+            self.stream = open(file, "w+b")
+            self.close_stream = True
+        elif isinstance(file, IOBase):
+            self.name = getattr(file, "name", "")
+            self.stream = file
+            self.close_stream = False
+        else:
+            raise TypeError('Unsupported file type ({})'.format(type(file)))
+
+        self.header = DbfHeader(code_page=code_page)
+        self.header.add_field(*fields)
+        if self.header.has_memo:
+            self.memo = memo.MemoFile(
+                memo_file or memo.MemoFile.memo_file_name(self.name, fpt),
+                fpt=fpt, new=True, buffer_size=memo.MemoFile.BUFFER_SIZE,
+            )
+        else:
+            self.memo = None
+        self.header.set_memo_file(self.memo)
+        # header is rewritten with the final record count on close
+        self.header.write(self.stream)
+
+        record_length = self.header.record_length
+        if buffer_records is None:
+            buffer_records = max(1, self.BUFFER_SIZE // record_length)
+        self._buffer = bytearray(buffer_records * record_length)
+        self._offset = 0
+
+    @property
+    def closed(self):
+        return self._buffer is None
+
+    @property
+    def record_count(self):
+        return self.header.record_count
+
+    def write(self, row):
+        """Append a record.
+
+        ``row`` is a `DbfRecord`, a sequence of field values in the
+        order of the fields or a mapping of the field names to values.
+        """
+        if isinstance(row, DbfRecord):
+            end = self._offset + self.header.record_length
+            self._buffer[self._offset:end] = row.to_bytes()
+        else:
+            encoder = self.header.encoder
+            encoder.encode_into(self._buffer, self._offset, encoder.values(row))
+        self._offset += self.header.record_length
+        self.header.record_count += 1
+        if self._offset == len(self._buffer):
+            self._flush_buffer()
+
+    def write_many(self, rows):
+        """Append all ``rows``; see `write`."""
+        for row in rows:
+            self.write(row)
+
+    def _flush_buffer(self):
+        """Write buffered records to the stream."""
+        if self._offset:
+            self.stream.write(memoryview(self._buffer)[:self._offset])
+            self._offset = 0
+
+    def flush(self):
+        """Write buffered records and flush the streams.
+
+        The header is not updated until `close`.
+        """
+        self._flush_buffer()
+        self.stream.flush()
+        if self.memo:
+            self.memo.flush()
+
+    def close(self):
+        """Write the header and the end of file marker, close the files."""
+        if self.closed:
+            return
+        self._flush_buffer()
+        # write SUB (ASCII 26) after last record
+        self.stream.write(b"\x1A")
+        self.header.last_update = datetime.date.today()
+        self.header.write(self.stream)
+        self.stream.flush()
+        if self.memo:
+            self.memo.close()
+        if self.close_stream:
+            self.stream.close()
+        self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# vim: et sts=4 sw=4 :
@@ -1,6 +1,9 @@
 #! /usr/bin/env python
 
-from distutils.core import setup
+try:
+    from setuptools import setup
+except ImportError:
+    from distutils.core import setup
 
 DESCRIPTION = """\
 dbfpy is a python-only module for reading and writing DBF-files.
@@ -27,6 +30,7 @@ def run():
         author="Jeff Kunce",
         maintainer_email="dbfpy-users@lists.sourceforge.net",
         packages=["dbfpy"],
+        extras_require={"numpy": ["numpy"]},
         long_description=DESCRIPTION,
         download_url=
         "http://sourceforge.net/project/showfiles.php?group_id=140566",
@@ -0,0 +1,847 @@
+__author__ = 'Wing'
+
+import io
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+import env
+import dbfpy
+from dbfpy import dbf
+from dbfpy.record import DbfRecord
+from dbfpy import arrays
+from dbfpy import vacuum
+from dbfpy.query import Equal, Prefix, Range
+
+
+EXAMPLES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples'
+)
+
+
+def copy_example_table(directory):
+    """Copy example table with its memo file, return the DBF name."""
+    name = os.path.join(directory, 'table.dbf')
+    shutil.copy(os.path.join(EXAMPLES_DIR, 'table.dbf'), name)
+    shutil.copy(
+        os.path.join(EXAMPLES_DIR, 'table.fpt'),
+        os.path.join(directory, 'table.FPT')
+    )
+    return name
+
+
+def record_char(rec):
+    return rec['CHAR']
+
+
+def count_records(records):
+    return sum(1 for rec in records)
+
+
+def record_id(rec):
+    return rec['ID']
+
+
+class CountingBytesIO(io.BytesIO):
+    """BytesIO which counts ``read`` and ``write`` calls."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = self.writes = 0
+
+    def read(self, *args):
+        self.reads += 1
+        return super().read(*args)
+
+    def write(self, *args):
+        self.writes += 1
+        return super().write(*args)
+
+
+def create_table(stream, count=10):
+    """Fill ``stream`` with a table of ``count`` records."""
+    db = dbf.Dbf(stream, new=True)
+    db.add_field(
+        ('I', 'ID'),
+        ('C', 'NAME', 10),
+        ('N', 'AMOUNT', 8, 2),
+        ('L', 'FLAG'),
+        ('D', 'DATE'),
+    )
+    for i in range(count):
+        rec = db.new_record()
+        rec['ID'] = i
+        rec['NAME'] = 'name %d' % i
+        rec['AMOUNT'] = i * 1.5
+        rec['FLAG'] = bool(i % 2)
+        rec['DATE'] = datetime.date(2014, 1, 1 + i % 28)
+        db.write_record(rec)
+    db.flush()
+    return db
+
+
+class DbfTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = CountingBytesIO()
+        self.dbf = create_table(self.stream, 10)
+
+    def tearDown(self):
+        del self.dbf
+
+    def test_iter(self):
+        records = list(self.dbf)
+        self.assertEqual(len(records), 10)
+        for i, rec in enumerate(records):
+            self.assertEqual(rec.index, i)
+            self.assertEqual(rec['ID'], i)
+            self.assertEqual(rec['NAME'], 'name %d' % i)
+            self.assertEqual(rec['AMOUNT'], i * 1.5)
+            self.assertEqual(rec.fields, self.dbf[i].fields)
+
+    def test_scan_buffered_reads(self):
+        self.stream.reads = 0
+        records = list(self.dbf.scan(buffer_records=4))
+        self.assertEqual([rec['ID'] for rec in records], list(range(10)))
+        # 4 + 4 + 2 records
+        self.assertEqual(self.stream.reads, 3)
+
+    def test_scan_range(self):
+        records = list(self.dbf.scan(3, 7, buffer_records=3))
+        self.assertEqual([rec['ID'] for rec in records], [3, 4, 5, 6])
+
+        with self.assertRaises(ValueError):
+            list(self.dbf.scan(buffer_records=0))
+
+    def test_iter_tuples(self):
+        rows = list(self.dbf.iter_tuples())
+        self.assertEqual(rows[3], tuple(self.dbf[3].fields))
+
+        rows = list(self.dbf.iter_tuples(named=True, start=8))
+        self.assertEqual(rows[0].ID, 8)
+        self.assertEqual(rows[1].NAME, 'name 9')
+        self.assertEqual(rows[1]._fields,
+                         ('ID', 'NAME', 'AMOUNT', 'FLAG', 'DATE'))
+
+        rows = list(self.dbf.iter_tuples(fields=['NAME', 'ID'], named=True))
+        self.assertEqual(rows[2], ('name 2', 2))
+        self.assertEqual(rows[2].ID, 2)
+
+        rows = list(self.dbf.iter_dicts())
+        self.assertEqual(rows[4], self.dbf[4].as_dict())
+        rows = list(self.dbf.iter_dicts(fields=['ID'], stop=2))
+        self.assertEqual(rows, [{b'ID': 0}, {b'ID': 1}])
+
+    def corrupt_date(self, index):
+        header = self.dbf.header
+        self.stream.seek(header.header_length + index * header.record_length +
+                         header['DATE'].start)
+        self.stream.write(b'2014XX01')
+
+    def test_iter_tuples_invalid(self):
+        self.corrupt_date(2)
+        with self.assertRaises(ValueError):
+            list(self.dbf.iter_tuples())
+        self.dbf.ignore_errors = True
+        invalid = dbf.Dbf.INVALID_VALUE
+        rows = list(self.dbf.iter_tuples(named=True))
+        self.assertEqual(rows[2], (2, 'name 2', 3.0, False, invalid))
+        self.assertEqual(rows[3].DATE, datetime.date(2014, 1, 4))
+        rows = list(self.dbf.iter_dicts(fields=['ID', 'DATE']))
+        self.assertEqual(rows[2], {b'ID': 2, b'DATE': invalid})
+
+    def test_iter_batches_invalid(self):
+        self.corrupt_date(2)
+        with self.assertRaises(ValueError):
+            list(self.dbf.iter_batches())
+        self.dbf.ignore_errors = True
+        (batch,) = list(self.dbf.iter_batches())
+        invalid = dbf.Dbf.INVALID_VALUE
+        self.assertEqual(batch['DATE'][1:4], [
+            datetime.date(2014, 1, 2), invalid, datetime.date(2014, 1, 4)
+        ])
+        self.assertEqual(list(batch['ID']), list(range(10)))
+        self.assertEqual(
+            [rec['DATE'] for rec in self.dbf.scan()][2], invalid
+        )
+
+    def test_skip_deleted(self):
+        for index in (0, 4, 9):
+            rec = self.dbf[index]
+            rec.delete()
+            self.dbf.write_record(rec)
+
+        self.assertEqual(self.dbf.live_count(), 7)
+        self.assertEqual(self.dbf.live_count(buffer_records=3), 7)
+        live = [1, 2, 3, 5, 6, 7, 8]
+        records = list(self.dbf.scan(skip_deleted=True, buffer_records=3))
+        self.assertEqual([rec.index for rec in records], live)
+        self.assertEqual([rec['ID'] for rec in records], live)
+        self.assertEqual(
+            list(self.dbf.scan(fields=['ID'], skip_deleted=True)),
+            [[i] for i in live]
+        )
+        self.assertEqual(
+            [rec['ID'] for rec in self.dbf.select(
+                {'FLAG': False}, skip_deleted=True)],
+            [2, 6, 8]
+        )
+
+    def test_append_many(self):
+        rows = [
+            (10, 'ten', 10.25, True, datetime.date(2015, 1, 10)),
+            {'ID': 11, b'NAME': 'eleven', 'date': (2015, 1, 11)},
+            self.dbf[2],
+        ]
+        self.stream.writes = 0
+        self.assertEqual(self.dbf.append_many(iter(rows), batch_records=2), 3)
+        # one write per batch
+        self.assertEqual(self.stream.writes, 2)
+        self.assertEqual(len(self.dbf), 13)
+        self.assertTrue(self.dbf.header.changed)
+
+        self.assertEqual(self.dbf[10].fields, list(rows[0]))
+        rec = self.dbf[11]
+        self.assertEqual(rec['NAME'], 'eleven')
+        self.assertEqual(rec['AMOUNT'], 0.0)
+        self.assertEqual(rec['DATE'], datetime.date(2015, 1, 11))
+        self.assertEqual(self.dbf[12].fields, self.dbf[2].fields)
+
+        self.assertEqual(self.dbf.extend([]), 0)
+        self.dbf.close()
+        table = dbf.Dbf(io.BytesIO(self.stream.getvalue()))
+        self.assertEqual([rec['ID'] for rec in table][-3:], [10, 11, 2])
+
+    def test_write_buffer(self):
+        self.dbf.write_buffer = 100
+        records = list(self.dbf)
+        self.stream.writes = 0
+        for index in (3, 4, 5, 1, 8, 9, 7):
+            rec = records[index]
+            rec['NAME'] = 'new %d' % index
+            self.dbf[index] = rec
+        rec = self.dbf.new_record()
+        rec['ID'] = 10
+        self.dbf.append(rec)
+        self.assertEqual(self.stream.writes, 0)
+
+        # pending records are visible
+        self.assertEqual(self.dbf[4]['NAME'], 'new 4')
+        self.assertEqual(self.dbf[10]['ID'], 10)
+        self.assertEqual(self.stream.writes, 0)
+
+        self.dbf.flush()
+        # runs 1, 3-5, 7-10 and three writes of the changed header
+        self.assertEqual(self.stream.writes, 3 + 3)
+        self.dbf.write_buffer = 0
+        table = dbf.Dbf(io.BytesIO(self.stream.getvalue()))
+        self.assertEqual(
+            [rec['NAME'] for rec in table],
+            ['name 0', 'new 1', 'name 2', 'new 3', 'new 4', 'new 5',
+             'name 6', 'new 7', 'new 8', 'new 9', '']
+        )
+
+        # scans see pending records
+        self.dbf.write_buffer = 2
+        rec = records[0]
+        rec['NAME'] = 'new 0'
+        self.dbf[0] = rec
+        self.assertEqual(next(iter(self.dbf))['NAME'], 'new 0')
+
+    def test_write_buffer_read_modify_write(self):
+        self.dbf.write_buffer = 100
+        self.stream.writes = 0
+        for index in range(10):
+            rec = self.dbf[index]
+            rec['AMOUNT'] = rec['AMOUNT'] + 1
+            self.dbf[index] = rec
+            # reads don't flush the buffer
+            self.assertEqual(self.dbf[index]['AMOUNT'], index * 1.5 + 1)
+        self.assertEqual(
+            [rec['AMOUNT'] for rec in self.dbf.scan(buffer_records=3)],
+            [i * 1.5 + 1 for i in range(10)]
+        )
+        self.assertEqual(self.stream.writes, 0)
+        self.dbf.flush()
+        # all records in a single write
+        self.assertEqual(self.stream.writes, 1)
+        table = dbf.Dbf(io.BytesIO(self.stream.getvalue()))
+        self.assertEqual([rec['AMOUNT'] for rec in table],
+                         [i * 1.5 + 1 for i in range(10)])
+
+        # pending appended records are visible to scans
+        rec = self.dbf.new_record()
+        rec['ID'] = 10
+        self.dbf.append(rec)
+        self.assertEqual([rec['ID'] for rec in self.dbf][-2:], [9, 10])
+        # direct updates write pending records first
+        self.dbf.update_where({'ID': 10}, {'NAME': 'ten'})
+        self.assertEqual(self.dbf[10]['NAME'], 'ten')
+
+    def test_update_field(self):
+        before = self.stream.getvalue()
+        self.dbf.update_field(2, 'NAME', 'changed')
+        self.assertEqual(self.dbf[2]['NAME'], 'changed')
+        self.assertEqual(self.dbf[2]['ID'], 2)
+        # only the field bytes are changed
+        after = self.stream.getvalue()
+        header = self.dbf.header
+        start = header.header_length + 2 * header.record_length + \
+            header['NAME'].start
+        self.assertEqual(before[:start], after[:start])
+        self.assertEqual(before[start + 10:], after[start + 10:])
+        self.assertRaises(IndexError, self.dbf.update_field, 10, 'ID', 1)
+        self.assertRaises(KeyError, self.dbf.update_field, 0, 'NOPE', 1)
+
+        self.assertEqual(self.dbf.update_column('ID', {0: 100, 9: 109}), 2)
+        self.stream.writes = 0
+        self.assertEqual(self.dbf.update_column('ID', {0: 100, 1: 1}), 0)
+        self.assertEqual(self.stream.writes, 0)
+        self.assertEqual(
+            [rec['ID'] for rec in self.dbf],
+            [100, 1, 2, 3, 4, 5, 6, 7, 8, 109]
+        )
+
+        self.stream.writes = 0
+        changed = self.dbf.update_column(
+            'AMOUNT', lambda value: value * 2 if value > 10 else value,
+            buffer_records=4,
+        )
+        self.assertEqual(changed, 3)
+        # one write per changed chunk
+        self.assertEqual(self.stream.writes, 2)
+        self.assertEqual(
+            [rec['AMOUNT'] for rec in self.dbf][6:],
+            [9.0, 21.0, 24.0, 27.0]
+        )
+
+        # deleted records are skipped
+        self.dbf.delete_where({'ID': 2})
+        seen = []
+        self.dbf.update_column('ID', lambda value: seen.append(value) or value)
+        self.assertNotIn(2, seen)
+        self.assertEqual(len(seen), 9)
+
+    def test_update_where(self):
+        before = self.stream.getvalue()
+        matched = self.dbf.update_where(
+            {'FLAG': True, 'ID': Range(5)},
+            {'NAME': 'odd', 'AMOUNT': lambda value: value + 1},
+        )
+        self.assertEqual(matched, 3)
+        self.assertEqual(
+            [(rec['ID'], rec['NAME'], rec['AMOUNT']) for rec in self.dbf][5:],
+            [(5, 'odd', 8.5), (6, 'name 6', 9.0), (7, 'odd', 11.5),
+             (8, 'name 8', 12.0), (9, 'odd', 14.5)]
+        )
+        # other fields are not rewritten
+        after = self.stream.getvalue()
+        header = self.dbf.header
+        start = header.header_length + 5 * header.record_length
+        self.assertEqual(before[:start + header['NAME'].start],
+                         after[:start + header['NAME'].start])
+
+    def test_delete_where(self):
+        self.stream.writes = 0
+        self.assertEqual(self.dbf.delete_where({'FLAG': False}), 5)
+        # one span per chunk
+        self.assertEqual(self.stream.writes, 1)
+        self.stream.writes = 0
+        self.assertEqual(
+            self.dbf.delete_where({'ID': Range(1, 4)}, buffer_records=2), 2
+        )
+        self.assertEqual(self.stream.writes, 2)
+        self.assertEqual(
+            [rec['ID'] for rec in self.dbf if not rec.deleted],
+            [5, 7, 9]
+        )
+        # deleted records aren't counted again
+        self.assertEqual(self.dbf.delete_where({'ID': Range(8)}), 1)
+        self.assertEqual(self.dbf.live_count(), 2)
+        # deleted records are skipped by update_where
+        self.assertEqual(self.dbf.update_where({}, {'ID': 0}), 2)
+
+    def test_pack(self):
+        self.dbf.delete_where({'FLAG': True})
+        self.dbf.delete_where({'ID': 0})
+        self.assertEqual(self.dbf.pack(buffer_records=3), 6)
+        self.assertEqual(self.dbf.record_count, 4)
+        self.assertEqual([rec['ID'] for rec in self.dbf], [2, 4, 6, 8])
+        header = self.dbf.header
+        data = self.stream.getvalue()
+        self.assertEqual(len(data),
+                         header.header_length + 4 * header.record_length + 1)
+        table = dbf.Dbf(io.BytesIO(data))
+        self.assertEqual([rec['NAME'] for rec in table],
+                         ['name 2', 'name 4', 'name 6', 'name 8'])
+        # nothing to remove
+        self.assertEqual(self.dbf.pack(), 0)
+        self.assertEqual(self.dbf.record_count, 4)
+
+    def test_compiled_decoder(self):
+        header = self.dbf.header
+        decoder = header.decoder
+        self.assertIs(header.decoder, decoder)
+        data = self.dbf[5].to_bytes()
+        self.assertEqual(
+            decoder.decode(data),
+            [5, 'name 5', 7.5, True, datetime.date(2014, 1, 6)]
+        )
+        # decoding from the offset of a larger buffer
+        self.assertEqual(decoder.decode(b'xx' + data, 2), decoder.decode(data))
+
+        header = dbf.DbfHeader()
+        header.add_field(('C', 'NAME', 5))
+        decoder = header.decoder
+        header.add_field(('I', 'ID'))
+        self.assertIsNot(header.decoder, decoder)
+        self.assertEqual(
+            header.decoder.decode(b' abc  \x07\x00\x00\x00'), ['abc', 7]
+        )
+
+    def test_compiled_encoder(self):
+        header = self.dbf.header
+        encoding = header.code_page.encoding
+        for rec in self.dbf:
+            rec.deleted = bool(rec.index % 3)
+            expected = b''.join(
+                [(b' ', b'*')[rec.deleted]] + [
+                    field.encode(value, encoding)
+                    for (field, value) in zip(header.fields, rec.fields)
+                ]
+            )
+            self.assertEqual(rec.to_bytes(), expected)
+
+            buffer = bytearray(header.record_length + 3)
+            header.encoder.encode_into(buffer, 3, rec.fields, rec.deleted)
+            self.assertEqual(bytes(buffer[3:]), expected)
+
+        # numeric overflow falls back to the field encoder
+        rec = self.dbf.new_record()
+        rec['AMOUNT'] = 10 ** 8
+        with self.assertRaises(ValueError):
+            rec.to_bytes()
+
+    def test_iter_columns(self):
+        rows = list(self.dbf.scan(fields=['AMOUNT', b'id']))
+        self.assertEqual(rows, [[i * 1.5, i] for i in range(10)])
+        rows = list(self.dbf.iter_columns(['NAME'], 8))
+        self.assertEqual(rows, [['name 8'], ['name 9']])
+        with self.assertRaises(KeyError):
+            list(self.dbf.iter_columns(['MISSING']))
+
+    def test_lazy_record(self):
+        header = self.dbf.header
+        data = bytearray(self.dbf[2].to_bytes())
+        # non canonical numeric value must survive the round trip
+        amount = header['AMOUNT']
+        data[amount.start:amount.start + amount.length] = b'3.0     '
+        data = bytes(data)
+
+        rec = DbfRecord(header, data=data, lazy=True)
+        self.assertEqual(rec['NAME'], 'name 2')
+        self.assertEqual(rec.to_bytes(), data)
+
+        rec['FLAG'] = True
+        rec[0] = 20
+        expected = header.encoder.encode(DbfRecord(header, data=data).fields)
+        self.assertNotEqual(expected, data)
+        result = rec.to_bytes()
+        self.assertEqual(result[amount.start:amount.start + amount.length],
+                         b'3.0     ')
+        self.assertEqual(DbfRecord(header, data=result).fields,
+                         [20, 'name 2', 3.0, True, datetime.date(2014, 1, 3)])
+
+        # full access keeps untouched fields raw
+        self.assertEqual(rec.fields[2], 3.0)
+        self.assertEqual(rec.fields, DbfRecord(header, data=result).fields)
+        self.assertIn('name 2', rec.as_dict().values())
+        self.assertEqual(rec.to_bytes(), result)
+        rec.fields[1] = 'other'
+        result = rec.to_bytes()
+        self.assertEqual(result[amount.start:amount.start + amount.length],
+                         b'3.0     ')
+        self.assertEqual(DbfRecord(header, data=result)['NAME'], 'other')
+
+        self.dbf.lazy = True
+        self.assertEqual([rec['ID'] for rec in self.dbf], list(range(10)))
+        self.assertEqual(self.dbf[4]['DATE'], datetime.date(2014, 1, 5))
+
+    def test_iter_batches(self):
+        rec = self.dbf[7]
+        rec.delete()
+        self.dbf.write_record(rec)
+
+        batches = list(self.dbf.iter_batches(4))
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
+        self.assertEqual([batch.start for batch in batches], [0, 4, 8])
+
+        batch = batches[1]
+        self.assertEqual(list(batch['ID']), [4, 5, 6, 7])
+        self.assertEqual(batch.column(b'amount').tolist(),
+                         [6.0, 7.5, 9.0, 10.5])
+        self.assertEqual(batch[1], ['name 4', 'name 5', 'name 6', 'name 7'])
+        self.assertEqual(list(batch.rows())[0], tuple(self.dbf[4].fields))
+        self.assertEqual(
+            [batch.is_deleted(i) for i in range(4)],
+            [False, False, False, True]
+        )
+        self.assertEqual(batch.deleted, b'\x08')
+
+        batch, = self.dbf.iter_batches(fields=['DATE', 'ID'], start=8)
+        self.assertEqual(batch.names, [b'DATE', b'ID'])
+        self.assertEqual(list(batch['ID']), [8, 9])
+
+    def test_select(self):
+        def ids(where):
+            return [rec['ID'] for rec in self.dbf.select(where)]
+
+        self.assertEqual(ids({'NAME': 'name 3'}), [3])
+        self.assertEqual(ids({'NAME': 'name 3 '}), [])
+        self.assertEqual(ids({'NAME': Prefix('name 1')}), [1])
+        self.assertEqual(ids({'ID': 4}), [4])
+        self.assertEqual(ids({'ID': Range(7)}), [7, 8, 9])
+        self.assertEqual(ids({'AMOUNT': Range(3, 6)}), [2, 3, 4])
+        self.assertEqual(ids({'AMOUNT': Equal(4.5)}), [3])
+        self.assertEqual(ids({'FLAG': True, 'ID': Range(None, 4)}), [1, 3])
+        self.assertEqual(ids({'DATE': datetime.date(2014, 1, 2)}), [1])
+        self.assertEqual(
+            ids({'DATE': Range(datetime.date(2014, 1, 9), (2014, 2, 1))}),
+            [8, 9]
+        )
+
+        rec = self.dbf[5]
+        rec['DATE'] = None
+        self.dbf.write_record(rec)
+        self.assertEqual(ids({'DATE': None}), [5])
+        self.assertEqual(
+            ids({'DATE': Range(datetime.date(2014, 1, 5))}), [4, 6, 7, 8, 9]
+        )
+
+        with self.assertRaises(TypeError):
+            ids({'ID': Prefix('1')})
+
+    @unittest.skipIf(arrays.numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        numpy = arrays.numpy
+        rec = self.dbf[1]
+        rec['DATE'] = None
+        rec.delete()
+        self.dbf.write_record(rec)
+
+        array = self.dbf.to_numpy()
+        self.assertEqual(array.dtype.names,
+                         ('ID', 'NAME', 'AMOUNT', 'FLAG', 'DATE'))
+        self.assertEqual(array['ID'].tolist(), list(range(10)))
+        self.assertEqual(array['NAME'][3], 'name 3')
+        self.assertEqual(array['AMOUNT'].tolist(),
+                         [i * 1.5 for i in range(10)])
+        self.assertEqual(array['FLAG'].tolist(),
+                         [bool(i % 2) for i in range(10)])
+        self.assertEqual(array['DATE'][2], numpy.datetime64('2014-01-03'))
+        self.assertTrue(numpy.isnat(array['DATE'][1]))
+
+        self.assertEqual(len(self.dbf.to_numpy(skip_deleted=True)), 9)
+        raw = self.dbf.to_numpy(convert=False)
+        self.assertEqual(raw['_deleted'][1], b'*')
+        self.assertEqual(raw['AMOUNT'][2], b'    3.00')
+
+        count = len(self.dbf)
+        self.dbf.from_numpy(array[2:5])
+        self.assertEqual(len(self.dbf), count + 3)
+        self.assertTrue(self.dbf.header.changed)
+        for i in range(3):
+            self.assertEqual(self.dbf[count + i].fields, self.dbf[2 + i].fields)
+
+        with self.assertRaises(ValueError):
+            self.dbf.from_numpy(numpy.array([(10 ** 9,)], [('AMOUNT', 'f8')]))
+
+
+class DbfFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.name = copy_example_table(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_mmap(self):
+        db = dbf.Dbf(self.name, read_only=True)
+        expected = [rec.fields for rec in db]
+        db.close()
+
+        db = dbf.Dbf(self.name, read_only=True, mmap=True)
+        self.assertEqual([rec.fields for rec in db], expected)
+        self.assertEqual(db[3].fields, expected[3])
+        self.assertEqual(db[0]['MEMO'], 'Mememomo')
+        db.close()
+
+        with self.assertRaises(ValueError):
+            dbf.Dbf(self.name, mmap=True)
+
+    def test_writer(self):
+        name = os.path.join(self.directory, 'out.dbf')
+        with dbfpy.DbfWriter(name, [
+            ('I', 'ID'),
+            ('C', 'NAME', 10),
+            ('M', 'NOTE'),
+        ], code_page='cp1252', buffer_records=2) as writer:
+            writer.write((1, 'one', 'first note'))
+            writer.write_many(
+                {'ID': i, 'NAME': 'n%d' % i, 'NOTE': 'note %d' % i}
+                for i in range(2, 6)
+            )
+            self.assertEqual(writer.record_count, 5)
+        self.assertTrue(writer.closed)
+
+        db = dbf.Dbf(name, read_only=True)
+        self.assertEqual(db.header.code_page.encoding, 'cp1252')
+        self.assertEqual(db.header.signature, 0x30)
+        self.assertEqual(
+            [rec.fields for rec in db],
+            [[1, 'one', 'first note']] +
+            [[i, 'n%d' % i, 'note %d' % i] for i in range(2, 6)]
+        )
+        db.close()
+
+        with open(name, 'rb') as stream:
+            data = stream.read()
+        self.assertEqual(len(data), db.header.header_length +
+                         5 * db.header.record_length + 1)
+        self.assertEqual(data[-1:], b'\x1A')
+
+    def write_memo_table(self, count):
+        name = os.path.join(self.directory, 'memo.dbf')
+        with dbfpy.DbfWriter(name, [('I', 'ID'), ('M', 'NOTE')]) as writer:
+            writer.write_many(
+                (i, 'note %d ' % i * (i * 20)) for i in range(count)
+            )
+        return name
+
+    def test_pack_memo(self):
+        name = self.write_memo_table(6)
+        memo_name = os.path.splitext(name)[0] + '.FPT'
+        db = dbf.Dbf(name)
+        expected = [rec['NOTE'] for rec in db if rec['ID'] % 2]
+        size = os.path.getsize(memo_name)
+        db.delete_where({'ID': Range(None, 4)})
+        db.delete_where({'ID': 1})
+        self.assertEqual(db.pack(memo=True), 5)
+        self.assertEqual([rec['NOTE'] for rec in db], expected[2:])
+        db.close()
+        self.assertLess(os.path.getsize(memo_name), size)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['memo.FPT', 'memo.dbf', 'table.FPT', 'table.dbf'])
+
+        db = dbf.Dbf(name)
+        self.assertEqual([rec['NOTE'] for rec in db], expected[2:])
+        db.close()
+
+    def test_alter(self):
+        name = os.path.join(self.directory, 'alter.dbf')
+        with open(name, 'w+b') as stream:
+            create_table(stream, 5).close()
+        os.chmod(name, 0o644)
+        db = dbf.Dbf(name)
+        rec = db[1]
+        rec.delete()
+        db.write_record(rec)
+        db.alter(
+            add=[('C', 'EMAIL', 20), ('M', 'NOTE')],
+            drop=['flag'],
+            resize={'NAME': 4, 'AMOUNT': (6, 1)},
+            buffer_records=2,
+        )
+        self.assertEqual(db.field_names,
+                         [b'ID', b'NAME', b'AMOUNT', b'DATE', b'EMAIL',
+                          b'NOTE'])
+        self.assertEqual(db.header.record_length, 1 + 4 + 4 + 6 + 8 + 20 + 4)
+        rec = db[4]
+        rec['NOTE'] = 'new note'
+        db.write_record(rec)
+        db.close()
+
+        db = dbf.Dbf(name)
+        self.assertEqual(
+            [rec.fields for rec in db],
+            [[i, 'name', i * 1.5, datetime.date(2014, 1, 1 + i), '', '']
+             for i in range(4)] +
+            [[4, 'name', 6.0, datetime.date(2014, 1, 5), '', 'new note']]
+        )
+        self.assertEqual([rec.deleted for rec in db],
+                         [False, True, False, False, False])
+        self.assertRaises(ValueError, db.alter, add=[('C', 'ID', 2)])
+        self.assertEqual(os.stat(name).st_mode & 0o777, 0o644)
+
+        # failed replace keeps the table usable
+        with mock.patch('os.replace', side_effect=OSError):
+            self.assertRaises(OSError, db.alter, drop=['EMAIL'])
+        self.assertIn(b'EMAIL', db.field_names)
+        self.assertEqual(db[4]['NOTE'], 'new note')
+        db.update_field(0, 'ID', 10)
+        db.close()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['alter.FPT', 'alter.dbf', 'table.FPT', 'table.dbf'])
+
+    def test_memo_reuse(self):
+        name = self.write_memo_table(4)
+        db = dbf.Dbf(name)
+        size = os.path.getsize(db.memo.name)
+        db.memo.reuse_blocks = True
+        db.memo.rebuild_free_map(db.memo_blocks())
+        self.assertEqual(db.memo.free_blocks, [])
+        db.update_field(3, 'NOTE', 'short')
+        db.update_field(2, 'NOTE', '')
+        db.update_where({'ID': 0}, {'NOTE': 'other'})
+        self.assertEqual(list(db.memo_blocks()), [2, 1, 0, 3])
+        db.update_column('NOTE', {1: 'reused'})
+        # values rewritten in place are changes too
+        self.assertTrue(db.update_field(1, 'NOTE', 'REUSED'))
+        self.assertFalse(db.update_field(1, 'NOTE', 'REUSED'))
+        self.assertEqual(db.update_column('NOTE', str.upper), 2)
+        self.assertEqual(db.update_column('NOTE', str.lower), 3)
+        self.assertEqual(list(db.memo_blocks()), [2, 1, 0, 3])
+        db.close()
+        self.assertEqual(os.path.getsize(db.memo.name), size)
+
+        db = dbf.Dbf(name)
+        self.assertEqual([rec['NOTE'] for rec in db],
+                         ['other', 'reused', '', 'short'])
+        db.close()
+
+        # lazy records written by the table rewrite their memo values
+        db = dbf.Dbf(name, lazy=True)
+        db.memo.reuse_blocks = True
+        rec = db[1]
+        rec['NOTE'] = 'edited'
+        db[1] = rec
+        db.write_record(rec)
+        rec = db[2]
+        rec['NOTE'] = 'new'
+        db[2] = rec
+        self.assertEqual(list(db.memo_blocks()), [2, 1, 4, 3])
+        self.assertEqual([rec['NOTE'] for rec in db],
+                         ['other', 'edited', 'new', 'short'])
+        # reading all fields doesn't store the memo value again
+        size = os.path.getsize(db.memo.name)
+        rec = db[0]
+        rec.as_dict()
+        db[0] = rec
+        rec.fields[1] = 'OTHER'
+        db[0] = rec
+        db.close()
+        self.assertEqual(os.path.getsize(db.memo.name), size)
+        db = dbf.Dbf(name)
+        self.assertEqual(list(db.memo_blocks()), [2, 1, 4, 3])
+        self.assertEqual(db[0]['NOTE'], 'OTHER')
+        db.close()
+
+    def test_vacuum_memo(self):
+        name = self.write_memo_table(8)
+        memo_name = os.path.splitext(name)[0] + '.FPT'
+        os.chmod(memo_name, 0o644)
+        db = dbf.Dbf(name)
+        # orphaned values
+        db.update_column('NOTE', lambda note: note.upper())
+        db.update_field(5, 'NOTE', 'five')
+        # shared value
+        header = db.header
+        position = header.header_length + header['NOTE'].start
+        db.stream.seek(position + 6 * header.record_length)
+        pointer = db.stream.read(4)
+        db.stream.seek(position + 7 * header.record_length)
+        db.stream.write(pointer)
+        expected = [rec['NOTE'] for rec in db]
+        self.assertEqual(expected[7], expected[6])
+        size = os.path.getsize(db.memo.name)
+
+        self.assertEqual(db.vacuum_memo(run_size=3), 6)
+        self.assertEqual(list(db.memo_blocks()), [0, 1, 2, 3, 4, 8, 6, 6])
+        self.assertEqual([rec['NOTE'] for rec in db], expected)
+        db.close()
+        self.assertLess(os.path.getsize(db.memo.name), size / 2)
+        self.assertEqual(os.stat(memo_name).st_mode & 0o777, 0o644)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['memo.FPT', 'memo.dbf', 'table.FPT', 'table.dbf'])
+
+        db = dbf.Dbf(name)
+        self.assertEqual([rec['NOTE'] for rec in db], expected)
+        self.assertEqual(db.vacuum_memo(), 6)
+        self.assertEqual(list(db.memo_blocks()), [0, 1, 2, 3, 4, 8, 6, 6])
+
+        # failed replace restores the pointers and keeps the memo file
+        db.update_column('NOTE', {0: 'orphan', 5: 'FIVE'})
+        expected[0] = 'orphan'
+        expected[5] = 'FIVE'
+        blocks = list(db.memo_blocks())
+        with mock.patch('os.replace', side_effect=OSError):
+            self.assertRaises(OSError, db.vacuum_memo, buffer_records=3)
+        self.assertEqual(list(db.memo_blocks()), blocks)
+        self.assertEqual([rec['NOTE'] for rec in db], expected)
+        db.close()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['memo.FPT', 'memo.dbf', 'table.FPT', 'table.dbf'])
+        db = dbf.Dbf(name)
+        self.assertEqual([rec['NOTE'] for rec in db], expected)
+
+        # no referenced values
+        db.update_column('NOTE', {index: '' for index in range(8)})
+        self.assertEqual(db.pack(memo=True), 0)
+        self.assertEqual(db.vacuum_memo(), 0)
+        self.assertEqual([rec['NOTE'] for rec in db], [''] * 8)
+        db.close()
+
+    def test_sorted_blocks(self):
+        blocks = [5, 0, 3, 9, 3, 1, 7, 7, 2, 0, 8, 5]
+        for run_size in (1, 2, 5, 100):
+            self.assertEqual(
+                list(vacuum.sorted_blocks(blocks, self.directory, run_size)),
+                [1, 2, 3, 5, 7, 8, 9]
+            )
+        block_map = vacuum.BlockMap(self.directory)
+        for (old, new) in [(2, 1), (5, 2), (9, 4)]:
+            block_map.add(old, new)
+        block_map.finish()
+        self.assertEqual([block_map.get(old) for old in (2, 5, 9)], [1, 2, 4])
+        self.assertRaises(KeyError, block_map.get, 3)
+        self.assertRaises(KeyError, block_map.get, 10)
+        block_map.close()
+
+        block_map = vacuum.BlockMap(self.directory)
+        block_map.finish()
+        self.assertRaises(KeyError, block_map.get, 1)
+        block_map.close()
+
+    def test_parallel(self):
+        db = dbf.Dbf(self.name, read_only=True)
+        expected = [rec['CHAR'] for rec in db]
+        self.assertEqual(list(db.parallel_map(record_char, workers=2,
+                                              chunk_records=2)), expected)
+        self.assertEqual(sum(db.parallel_scan(count_records, workers=2)),
+                         len(expected))
+        db.close()
+
+        # workers use the ignore_errors flag of the table
+        name = os.path.join(self.directory, 'invalid.dbf')
+        with open(name, 'w+b') as stream:
+            header = create_table(stream, 5).header
+            stream.seek(header.header_length + 2 * header.record_length +
+                        header['DATE'].start)
+            stream.write(b'2014XX01')
+        db = dbf.Dbf(name, read_only=True)
+        self.assertRaises(ValueError, db.parallel_scan, count_records, 2)
+        db.ignore_errors = True
+        self.assertEqual(list(db.parallel_map(record_id, workers=2)),
+                         list(range(5)))
+        self.assertEqual(sum(db.parallel_scan(count_records, workers=2)), 5)
+        db.close()
+
+        self.assertEqual(dbf.parallel.split_range(5, 2), [(0, 3), (3, 5)])
+        self.assertEqual(dbf.parallel.split_range(2, 4), [(0, 1), (1, 2)])
+        self.assertEqual(dbf.parallel.split_range(0, 4), [])
+
+if __name__ == '__main__':
+    unittest.main()
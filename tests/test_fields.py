@@ -2,6 +2,7 @@ __author__ = 'Wing'
 
 import unittest
 import struct
+import datetime
 import env
 from dbfpy import fields
 
@@ -180,5 +181,25 @@ class FieldsTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             fields.DbfFields.parse(bytes(field_string))
 
+    def test_column_decoders(self):
+        field = fields.DbfNumericField(b'NUM', 6, decimal_count=2)
+        decode = field.make_column_decoder('ascii')
+        self.assertEqual(decode((b'  1.50', b' -2.25')).tolist(), [1.5, -2.25])
+        # blank and NUL padded values use the single value decoder
+        self.assertEqual(
+            decode((b'  1.50', b'      ', b'3.5\x00\x00\x00')).tolist(),
+            [1.5, 0.0, 3.5]
+        )
+
+        field = fields.DbfDateField(b'DATE')
+        decode = field.make_column_decoder('ascii')
+        self.assertEqual(
+            decode((b'20140102', b'        ', b'20140102', b'2014 1 3')),
+            [datetime.date(2014, 1, 2), None,
+             datetime.date(2014, 1, 2), datetime.date(2014, 1, 3)]
+        )
+        with self.assertRaises(ValueError):
+            decode((b'20141340',))
+
 if __name__ == '__main__':
     unittest.main()
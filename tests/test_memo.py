@@ -0,0 +1,173 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import env
+from dbfpy.memo import MemoFile, MemoData
+
+
+class CountingBytesIO(io.BytesIO):
+    """In-memory stream counting ``read`` and ``write`` calls."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.reads = self.writes = 0
+
+    def read(self, *args):
+        self.reads += 1
+        return super().read(*args)
+
+    def write(self, *args):
+        self.writes += 1
+        return super().write(*args)
+
+
+class MemoFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = CountingBytesIO()
+        self.memo = MemoFile(self.stream, blocksize=64, new=True)
+
+    def test_write_read(self):
+        first = self.memo.write(b'first value')
+        second = self.memo.write(MemoData(b'x' * 100, MemoData.TYPE_OBJECT))
+        self.assertEqual(first, 8)
+        self.assertEqual(second, 9)
+        self.assertEqual(self.memo.read(first), b'first value')
+        value = self.memo.read(second)
+        self.assertEqual(value, b'x' * 100)
+        self.assertEqual(value.type, MemoData.TYPE_OBJECT)
+
+        memo = MemoFile(io.BytesIO(self.stream.getvalue()))
+        self.assertEqual(memo.blocksize, 64)
+        self.assertEqual(memo.tail, 11)
+        self.assertEqual(memo.read(second), b'x' * 100)
+
+    def test_write_many(self):
+        self.stream.writes = 0
+        values = [b'value %d' % i * i for i in range(20)]
+        blocks = self.memo.write_many(values)
+        # data and the tail
+        self.assertEqual(self.stream.writes, 2)
+        self.assertEqual([self.memo.read(block) for block in blocks], values)
+        self.assertEqual(self.memo.write_many([]), [])
+
+    def test_buffer(self):
+        self.memo.buffer_size = 1000
+        self.stream.writes = 0
+        blocks = [self.memo.write(b'x' * 100) for i in range(12)]
+        self.assertEqual(self.stream.writes, 1)
+        size = len(self.stream.getvalue())
+        self.memo.flush()
+        self.assertEqual(self.stream.writes, 3)
+        self.assertEqual(self.memo.read(blocks[-1]), b'x' * 100)
+        self.assertEqual(len(self.stream.getvalue()), size + 4 * 128)
+        memo = MemoFile(io.BytesIO(self.stream.getvalue()))
+        self.assertEqual(memo.tail, blocks[-1] + 2)
+
+    def test_reuse_blocks(self):
+        # 1, 2, 3 and 1 blocks
+        blocks = self.memo.write_many(
+            [b'a' * 50, b'b' * 100, b'c' * 150, b'd' * 10]
+        )
+        self.assertEqual(blocks, [8, 9, 11, 14])
+        tail = self.memo.tail
+        # appended without reuse
+        self.assertEqual(self.memo.rewrite(blocks[1], b'x'), tail)
+        self.memo.free(blocks[0])
+        self.assertEqual(self.memo.free_blocks, [])
+
+        self.memo.reuse_blocks = True
+        self.assertEqual(self.memo.rewrite(blocks[2], b'y' * 10), blocks[2])
+        self.assertEqual(self.memo.read(blocks[2]), b'y' * 10)
+        self.assertEqual(self.memo.free_blocks, [(12, 2)])
+        self.memo.free(blocks[1])
+        self.assertEqual(self.memo.free_blocks, [(9, 2), (12, 2)])
+        self.memo.free(blocks[2])
+        self.assertEqual(self.memo.free_blocks, [(9, 5)])
+        # too large value is moved to the joined free run
+        self.assertEqual(self.memo.rewrite(blocks[0], b'z' * 200), 8)
+        self.assertEqual(self.memo.free_blocks, [(12, 2)])
+        self.assertEqual(self.memo.write_many([b'1', b'2', b'3']),
+                         [12, 13, tail + 1])
+        self.assertEqual(self.memo.read(8), b'z' * 200)
+        self.assertEqual(self.memo.read(13), b'2')
+
+    def test_free_map(self):
+        blocks = self.memo.write_many([b'a' * 100] * 5)
+        self.memo.rebuild_free_map([0, blocks[1], blocks[3], blocks[1]])
+        self.assertEqual(self.memo.free_blocks, [(8, 2), (12, 2), (16, 2)])
+
+        name = os.path.join(tempfile.mkdtemp(), 'memo.free')
+        try:
+            self.memo.save_free_map(name)
+            memo = MemoFile(io.BytesIO(self.stream.getvalue()))
+            self.assertTrue(memo.load_free_map(name))
+            self.assertEqual(memo.free_blocks, self.memo.free_blocks)
+            # stale map
+            memo.write(b'x')
+            memo.rebuild_free_map([])
+            self.assertFalse(memo.load_free_map(name))
+            self.assertEqual(memo.free_blocks, [(8, 11)])
+            self.assertFalse(memo.load_free_map(name + '.missing'))
+        finally:
+            shutil.rmtree(os.path.dirname(name))
+
+    def test_cache(self):
+        blocks = [self.memo.write(b'value %d' % i) for i in range(3)]
+        self.memo.cache_size = 2
+        self.stream.reads = 0
+        for block in blocks + blocks[1:] + blocks[:1]:
+            self.memo.read(block)
+        self.assertEqual(self.memo.cache_hits, 2)
+        self.assertEqual(self.memo.cache_misses, 4)
+        self.assertEqual(self.stream.reads, 8)
+        self.assertEqual(self.memo.read(blocks[0]), b'value 0')
+        self.assertEqual(self.memo.cache_hits, 3)
+
+    def test_blob(self):
+        value = bytes(range(256)) * 10
+        block = self.memo.write(MemoData(value, MemoData.TYPE_PICTURE))
+        blob = self.memo.open_blob(block)
+        self.assertEqual(blob.type, MemoData.TYPE_PICTURE)
+        chunks = iter(lambda: blob.read(100), b'')
+        self.assertEqual(b''.join(chunks), value)
+        self.assertEqual(self.memo.open_blob(block).read(), value)
+
+
+class DbtMemoFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memo = MemoFile(io.BytesIO(), fpt=False, new=True)
+
+    def test_read(self):
+        values = [b'a' * 511, b'b' * 510, b'c' * 1500 + b'\x1Ac', b'']
+        blocks = [self.memo.write(value) for value in values]
+        self.assertEqual(blocks, [1, 3, 4, 7])
+        self.assertEqual([self.memo.read(block) for block in blocks], values)
+
+    def test_blob(self):
+        values = [b'a' * 511, b'b' * 510, b'c' * 1500 + b'\x1Ac', b'']
+        blocks = [self.memo.write(value) for value in values]
+        for size in (1, 2, 100, 510, 511, 512, 4096):
+            for (block, value) in zip(blocks, values):
+                blob = self.memo.open_blob(block)
+                chunks = iter(lambda: blob.read(size), b'')
+                self.assertEqual(b''.join(chunks), value)
+
+    def test_copy_from(self):
+        values = [b'a' * 511, b'b' * 10, b'c' * 1500]
+        blocks = [self.memo.write(value) for value in values]
+        memo = MemoFile(io.BytesIO(), fpt=False, new=True)
+        self.assertEqual(
+            [memo.copy_from(self.memo, block) for block in blocks[::-1]],
+            [1, 4, 5]
+        )
+        self.assertEqual(memo.tail, 7)
+        self.assertEqual([memo.read(block) for block in (5, 4, 1)], values)
+        self.assertRaises(ValueError, MemoFile(io.BytesIO(), new=True)
+                          .copy_from, self.memo, blocks[0])
+
+if __name__ == '__main__':
+    unittest.main()